@@ -2,6 +2,16 @@ from flask import Flask
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
+
+# Load environment variables from .env before importing blueprints/services,
+# which read their configuration (cache sizes, timeouts, warmer schedule) at import time
+load_dotenv()
+
+# Schema migrations: a version check when the gunicorn master already applied them;
+# otherwise workers serialize on the migration file lock
+from models.migrations import migrate_all
+migrate_all()
+
 from routes.crop_recommend import crop_recommend_bp
 from routes.weather import weather_bp
 from routes.tips import tips_bp
@@ -12,12 +22,13 @@ from routes.dashboard import dashboard_bp
 from routes.satellite_insight import satellite_insight_bp
 from routes.crop_prices import crop_prices_bp
 from routes.marketplace import marketplace_bp
+from routes.listing_changes import listing_changes_bp
 from routes.auth import auth_bp
 from routes.certification import certification_bp
 from routes.superuser import superuser_bp
-
-# Load environment variables from .env
-load_dotenv()
+from routes.stats import stats_bp
+from routes.locations import locations_bp
+from services.cache_warmer import start_cache_warmer
 
 app = Flask(__name__)
 # Restrict CORS in production via env FRONTEND_ORIGIN; default allows all for dev
@@ -35,9 +46,15 @@ app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
 app.register_blueprint(satellite_insight_bp, url_prefix='/api/satellite-insight')
 app.register_blueprint(crop_prices_bp, url_prefix='/api/crop-prices')
 app.register_blueprint(marketplace_bp, url_prefix='/api/marketplace')
+app.register_blueprint(listing_changes_bp, url_prefix='/api/marketplace/changes')
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(certification_bp, url_prefix='/api/certification')
 app.register_blueprint(superuser_bp, url_prefix='/api/superuser')
+app.register_blueprint(stats_bp, url_prefix='/api/stats')
+app.register_blueprint(locations_bp, url_prefix='/api/locations')
+
+# Scheduled cache warmer (WARMER_INTERVAL_MINUTES); runs once per interval across workers
+start_cache_warmer()
 
 # Health check endpoint for Render
 @app.get('/health')
@@ -3,4 +3,15 @@ workers = 2
 threads = 4
 worker_class = 'gthread'
 bind = '0.0.0.0:8000'
-timeout = 120
\ No newline at end of file
+timeout = 120
+
+
+def on_starting(server):
+    # Apply schema migrations once per deploy, before any worker starts serving
+    from dotenv import load_dotenv
+    load_dotenv()
+    from models.db import close_all
+    from models.migrations import migrate_all
+    migrate_all()
+    # SQLite connections must not cross fork(): workers open their own
+    close_all()
@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Shared SQLite access for the blueprints: one long-lived connection per thread and database file
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+AUTH_DB = os.getenv('AUTH_DB_PATH', os.path.join(BASE_DIR, 'auth.db'))
+MARKETPLACE_DB = os.getenv('MARKETPLACE_DB_PATH', os.path.join(BASE_DIR, 'marketplace.db'))
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_CACHE_KB = int(os.getenv('SQLITE_CACHE_KB', '8192'))
+SQLITE_MMAP_MB = int(os.getenv('SQLITE_MMAP_MB', '64'))
+# Compiled statements kept per connection, keyed by SQL text (reused across requests)
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
+
+_local = threading.local()
+
+
+def _open(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(
+        path,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=SQLITE_STATEMENT_CACHE,
+        check_same_thread=False,
+    )
+    # WAL lets readers proceed while a writer commits; NORMAL sync is durable across app crashes
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KB}')
+    conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+def get_conn(path):
+    """This thread's connection to a database file, opened on first use (and again after fork)."""
+    conns = getattr(_local, 'conns', None)
+    if conns is None or getattr(_local, 'pid', None) != os.getpid():
+        conns = _local.conns = {}
+        _local.versions = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _open(path)
+    return conn
+
+
+@contextmanager
+def connect(path):
+    """
+    Borrow this thread's connection. Commits an open transaction on normal exit and
+    rolls back on error, so a pooled connection never carries a transaction (or its
+    write lock) into the next request.
+    """
+    conn = get_conn(path)
+    try:
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    else:
+        if conn.in_transaction:
+            conn.commit()
+
+
+def table_versions(path):
+    """
+    {table: (version, updated_at)} from the table_versions counters that write triggers bump.
+    Re-read only when PRAGMA data_version (commits by other connections) or this connection's
+    total_changes has moved, so polling an unchanged database reads no table pages.
+    """
+    conn = get_conn(path)
+    stamp = (conn.execute('PRAGMA data_version').fetchone()[0], conn.total_changes)
+    versions = _local.versions.get(path)
+    if versions is None or versions[0] != stamp:
+        rows = conn.execute('SELECT table_name, version, updated_at FROM table_versions').fetchall()
+        versions = _local.versions[path] = (stamp, {name: (version, updated_at) for name, version, updated_at in rows})
+    return versions[1]
+
+
+def close_all():
+    """Close this thread's connections (tests, one-off scripts, and the gunicorn master before fork)."""
+    for conn in (getattr(_local, 'conns', None) or {}).values():
+        conn.close()
+    _local.conns = {}
+    _local.versions = {}
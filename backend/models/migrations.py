@@ -0,0 +1,296 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: fall back to SQLite's write lock alone
+    fcntl = None
+
+from models.db import get_conn, AUTH_DB, MARKETPLACE_DB
+from services.crop_taxonomy import crop_id as canonical_crop_id
+from services.gazetteer import coordinates
+
+# Ordered schema migrations per database. Each step is SQL or a function taking the
+# connection; a migration's steps and its schema_version row commit together.
+
+
+def add_column(table, column, decl):
+    """ALTER TABLE ADD COLUMN that is a no-op when the column exists (databases created before migrations)."""
+    def step(conn):
+        if column not in {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+    step.__name__ = f'add_column_{table}_{column}'
+    return step
+
+
+def _backfill_listing_crop_ids(conn):
+    rows = conn.execute('SELECT id, crop_name FROM listings WHERE crop_id IS NULL').fetchall()
+    updates = [(canonical_crop_id(name), item_id) for item_id, name in rows if canonical_crop_id(name)]
+    conn.executemany('UPDATE listings SET crop_id = ? WHERE id = ?', updates)
+
+
+def _backfill_listing_coordinates(conn):
+    # Gazetteer only: migrations stay offline, new listings geocode on create
+    rows = conn.execute('SELECT id, location FROM listings WHERE lat IS NULL').fetchall()
+    updates = [coordinates(location) + (item_id,) for item_id, location in rows if coordinates(location)]
+    conn.executemany('UPDATE listings SET lat = ?, lon = ? WHERE id = ?', updates)
+
+
+VERSIONED_TABLES = ('listings', 'certification_reports', 'equipment_requests')
+_NOW = "strftime('%Y-%m-%dT%H:%M:%SZ', 'now')"
+
+
+def _version_triggers(table):
+    """Seed a table's version row and bump it on every insert, update and delete (any write path)."""
+    bump = f"UPDATE table_versions SET version = version + 1, updated_at = {_NOW} WHERE table_name = '{table}';"
+    steps = [f"INSERT OR IGNORE INTO table_versions (table_name, version, updated_at) VALUES ('{table}', 1, {_NOW})"]
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        steps.append(f'CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN {bump} END')
+    return steps
+
+
+AUTH_MIGRATIONS = [
+    (1, 'create users', [
+        '''CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )''',
+    ]),
+    (2, 'users.role', [add_column('users', 'role', 'TEXT DEFAULT "user"')]),
+]
+
+MARKETPLACE_MIGRATIONS = [
+    (1, 'create listings', [
+        '''CREATE TABLE IF NOT EXISTS listings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            crop_name TEXT NOT NULL,
+            quantity TEXT NOT NULL,
+            price REAL NOT NULL,
+            location TEXT NOT NULL,
+            contact TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )''',
+    ]),
+    (2, 'listings owner and verification columns', [
+        add_column('listings', 'owner_sub', 'TEXT'),
+        add_column('listings', 'verified_by_superuser', 'INTEGER DEFAULT 0'),
+        add_column('listings', 'verified_at', 'TEXT'),
+        add_column('listings', 'verified_by_sub', 'TEXT'),
+    ]),
+    (3, 'create certification_reports', [
+        '''CREATE TABLE IF NOT EXISTS certification_reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id TEXT,
+            crop_name TEXT,
+            reason TEXT,
+            details TEXT,
+            reporter_sub TEXT,
+            created_at TEXT NOT NULL
+        )''',
+    ]),
+    (4, 'create equipment_requests', [
+        '''CREATE TABLE IF NOT EXISTS equipment_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            equipment_id TEXT,
+            equipment_name TEXT,
+            brand TEXT,
+            origin TEXT,
+            compliance_info TEXT,
+            created_by_sub TEXT,
+            created_at TEXT,
+            verified_by_superuser INTEGER DEFAULT 0,
+            verified_at TEXT,
+            verified_by_sub TEXT
+        )''',
+    ]),
+    (5, 'listings.crop_id from the crop taxonomy', [
+        add_column('listings', 'crop_id', 'TEXT'),
+        'CREATE INDEX IF NOT EXISTS idx_listings_crop_id ON listings (crop_id)',
+        _backfill_listing_crop_ids,
+    ]),
+    (6, 'indexes for newest-first lists and owner lookups', [
+        'CREATE INDEX IF NOT EXISTS idx_listings_created ON listings (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_listings_owner ON listings (owner_sub)',
+        'CREATE INDEX IF NOT EXISTS idx_certification_reports_created ON certification_reports (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_equipment_requests_created ON equipment_requests (created_at)',
+    ]),
+    # Each feed filter gets (filter, created_at, id) so a keyset page is one index range scan
+    (7, 'composite indexes for the filtered listing feed', [
+        'DROP INDEX IF EXISTS idx_listings_crop_id',
+        'DROP INDEX IF EXISTS idx_listings_owner',
+        'CREATE INDEX IF NOT EXISTS idx_listings_crop_created ON listings (crop_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_listings_owner_created ON listings (owner_sub, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_listings_location_created ON listings (location COLLATE NOCASE, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_listings_verified_created ON listings (verified_by_superuser, created_at, id)',
+    ]),
+    # External-content FTS5 index over listings, kept in sync by triggers on every write path.
+    # M* keeps Devanagari/Kannada vowel signs inside words; crop_id lets search expand taxonomy aliases.
+    (8, 'listings_fts full-text index', [
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5(
+            crop_name, location, quantity, crop_id,
+            content='listings', content_rowid='id',
+            tokenize="unicode61 remove_diacritics 2 categories 'L* N* Co M*'",
+            prefix='2 3'
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS listings_fts_insert AFTER INSERT ON listings BEGIN
+            INSERT INTO listings_fts (rowid, crop_name, location, quantity, crop_id)
+            VALUES (new.id, new.crop_name, new.location, new.quantity, new.crop_id);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS listings_fts_delete AFTER DELETE ON listings BEGIN
+            INSERT INTO listings_fts (listings_fts, rowid, crop_name, location, quantity, crop_id)
+            VALUES ('delete', old.id, old.crop_name, old.location, old.quantity, old.crop_id);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS listings_fts_update AFTER UPDATE OF crop_name, location, quantity, crop_id ON listings BEGIN
+            INSERT INTO listings_fts (listings_fts, rowid, crop_name, location, quantity, crop_id)
+            VALUES ('delete', old.id, old.crop_name, old.location, old.quantity, old.crop_id);
+            INSERT INTO listings_fts (rowid, crop_name, location, quantity, crop_id)
+            VALUES (new.id, new.crop_name, new.location, new.quantity, new.crop_id);
+        END''',
+        "INSERT INTO listings_fts (listings_fts) VALUES ('rebuild')",
+    ]),
+    # Listing coordinates plus an R*Tree of their points, maintained by triggers like listings_fts
+    (9, 'listings coordinates and listings_geo spatial index', [
+        add_column('listings', 'lat', 'REAL'),
+        add_column('listings', 'lon', 'REAL'),
+        'CREATE VIRTUAL TABLE IF NOT EXISTS listings_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon)',
+        '''CREATE TRIGGER IF NOT EXISTS listings_geo_insert AFTER INSERT ON listings
+            WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN
+            INSERT INTO listings_geo (id, min_lat, max_lat, min_lon, max_lon) VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS listings_geo_delete AFTER DELETE ON listings BEGIN
+            DELETE FROM listings_geo WHERE id = old.id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS listings_geo_update AFTER UPDATE OF lat, lon ON listings BEGIN
+            DELETE FROM listings_geo WHERE id = old.id;
+            INSERT INTO listings_geo (id, min_lat, max_lat, min_lon, max_lon)
+            SELECT new.id, new.lat, new.lat, new.lon, new.lon WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+        END''',
+        _backfill_listing_coordinates,
+    ]),
+    (10, 'table_versions counters for conditional GET', [
+        '''CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )''',
+    ] + [step for table in VERSIONED_TABLES for step in _version_triggers(table)]),
+    # Append-only listing change log behind /api/marketplace/changes. Triggers record every
+    # create, delete and verification; the oldest events beyond 100k are pruned every 1000.
+    (11, 'listing_changes log', [
+        '''CREATE TABLE IF NOT EXISTS listing_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            listing_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TEXT NOT NULL,
+            data TEXT NOT NULL
+        )''',
+        f'''CREATE TRIGGER IF NOT EXISTS listing_changes_create AFTER INSERT ON listings BEGIN
+            INSERT INTO listing_changes (listing_id, op, changed_at, data) VALUES (new.id, 'create', {_NOW}, json_object(
+                'id', new.id, 'crop_name', new.crop_name, 'quantity', new.quantity, 'price', new.price,
+                'location', new.location, 'contact', new.contact, 'created_at', new.created_at,
+                'owner_sub', new.owner_sub, 'verified_by_superuser', json(CASE WHEN new.verified_by_superuser THEN 'true' ELSE 'false' END),
+                'verified_at', new.verified_at, 'verified_by_sub', new.verified_by_sub, 'crop_id', new.crop_id,
+                'lat', new.lat, 'lon', new.lon));
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS listing_changes_verify AFTER UPDATE OF verified_by_superuser, verified_at ON listings
+            WHEN new.verified_by_superuser IS NOT old.verified_by_superuser OR new.verified_at IS NOT old.verified_at BEGIN
+            INSERT INTO listing_changes (listing_id, op, changed_at, data) VALUES (
+                new.id, CASE WHEN new.verified_by_superuser THEN 'verify' ELSE 'unverify' END, {_NOW}, json_object(
+                'id', new.id, 'verified_by_superuser', json(CASE WHEN new.verified_by_superuser THEN 'true' ELSE 'false' END),
+                'verified_at', new.verified_at, 'verified_by_sub', new.verified_by_sub));
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS listing_changes_delete AFTER DELETE ON listings BEGIN
+            INSERT INTO listing_changes (listing_id, op, changed_at, data) VALUES (old.id, 'delete', {_NOW}, json_object('id', old.id));
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS listing_changes_prune AFTER INSERT ON listing_changes WHEN new.seq % 1000 = 0 BEGIN
+            DELETE FROM listing_changes WHERE seq <= new.seq - 100000;
+        END''',
+    ]),
+]
+
+MIGRATIONS = {
+    AUTH_DB: AUTH_MIGRATIONS,
+    MARKETPLACE_DB: MARKETPLACE_MIGRATIONS,
+}
+
+
+def current_version(conn):
+    conn.execute(
+        '''CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )'''
+    )
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+@contextmanager
+def _migration_lock(path):
+    """
+    Exclusive file lock next to the database. Processes migrating at the same time wait
+    here for the whole run, not on busy_timeout, which a long backfill would outlast.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f'{path}.migrate.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def migrate(path, migrations):
+    """
+    Apply pending migrations to one database; returns the versions applied here.
+    Processes serialize on a migration file lock, and each migration runs under
+    BEGIN IMMEDIATE and re-reads the version inside it, so each step runs once.
+    """
+    conn = get_conn(path)
+    latest = migrations[-1][0] if migrations else 0
+    # Fast path for every boot after the first: one read, no write lock
+    if current_version(conn) >= latest:
+        return []
+    with _migration_lock(path):
+        return _apply(conn, path, migrations)
+
+
+def _apply(conn, path, migrations):
+    applied = []
+    for version, name, steps in migrations:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                'INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                (version, name, datetime.now(timezone.utc).isoformat())
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+        print(f"[LOG] Migration {version} ({name}) applied to {path}")
+    return applied
+
+
+def migrate_all():
+    return {path: migrate(path, migrations) for path, migrations in MIGRATIONS.items()}
+
+
+if __name__ == '__main__':
+    # Run once per deploy (also done by the gunicorn master on start): python -m models.migrations
+    for path, applied in migrate_all().items():
+        print(f"{path}: {'applied ' + ', '.join(map(str, applied)) if applied else 'up to date'}")
@@ -1,5 +1,4 @@
 from flask import Blueprint, request, jsonify
-import sqlite3
 import os
 from datetime import datetime, timedelta, timezone
 import jwt
@@ -7,11 +6,13 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 from flask_cors import CORS
 
+from models.db import connect, AUTH_DB
+
 auth_bp = Blueprint('auth', __name__)
 CORS(auth_bp)
 
 # Database path within backend folder
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'auth.db')
+DB_PATH = AUTH_DB
 
 # JWT secret and settings
 JWT_SECRET = os.getenv('JWT_SECRET', 'change-me-in-prod')
@@ -19,36 +20,6 @@ JWT_ALG = 'HS256'
 JWT_TTL_DAYS = int(os.getenv('JWT_TTL_DAYS', '7'))
 
 
-def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        conn.execute(
-            '''CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )'''
-        )
-        # Migration: add role column if missing
-        try:
-            conn.execute('ALTER TABLE users ADD COLUMN role TEXT DEFAULT "user"')
-        except Exception:
-            pass
-        conn.commit()
-    finally:
-        conn.close()
-
-
-init_db()
-
-
-def get_conn():
-    return sqlite3.connect(DB_PATH)
-
-
 def issue_token(user):
     now = datetime.now(timezone.utc)
     payload = {
@@ -90,8 +61,7 @@ def register():
     if errors:
         return jsonify({'error': 'Validation failed', 'details': errors}), 400
 
-    conn = get_conn()
-    try:
+    with connect(DB_PATH) as conn:
         cur = conn.execute('SELECT id FROM users WHERE email = ?', (email,))
         if cur.fetchone():
             return jsonify({'error': 'Email already registered'}), 409
@@ -107,8 +77,6 @@ def register():
         user = {'id': user_id, 'name': name, 'email': email, 'role': 'user'}
         token = issue_token(user)
         return jsonify({'token': token, 'user': user}), 201
-    finally:
-        conn.close()
 
 
 @auth_bp.route('/login', methods=['POST', 'OPTIONS'])
@@ -123,8 +91,7 @@ def login():
     if not email or not password:
         return jsonify({'error': 'email and password are required'}), 400
 
-    conn = get_conn()
-    try:
+    with connect(DB_PATH) as conn:
         cur = conn.execute('SELECT id, name, email, password_hash, role FROM users WHERE email = ?', (email,))
         row = cur.fetchone()
         if not row or not check_password_hash(row[3], password):
@@ -132,8 +99,6 @@ def login():
         user = {'id': row[0], 'name': row[1], 'email': row[2], 'role': row[4] or 'user'}
         token = issue_token(user)
         return jsonify({'token': token, 'user': user})
-    finally:
-        conn.close()
 
 
 @auth_bp.route('/me', methods=['GET'])
@@ -172,15 +137,12 @@ def set_role():
     if not email:
         return jsonify({'error': 'email required'}), 400
 
-    conn = get_conn()
-    try:
+    with connect(DB_PATH) as conn:
         cur = conn.execute('UPDATE users SET role = ? WHERE email = ?', (role, email))
         conn.commit()
         if cur.rowcount == 0:
             return jsonify({'error': 'user not found'}), 404
         return jsonify({'success': True, 'email': email, 'role': role})
-    finally:
-        conn.close()
 
 
 @auth_bp.route('/su-login', methods=['POST'])
@@ -1,10 +1,11 @@
 from flask import Blueprint, request, jsonify
 import os
-import sqlite3
 from datetime import datetime, timezone
 import jwt
 
 from services.gemini_service import verify_product_certification
+from models.db import connect, MARKETPLACE_DB
+from routes.conditional import versioned_json
 
 certification_bp = Blueprint('certification', __name__)
 
@@ -13,30 +14,7 @@ JWT_SECRET = os.getenv('JWT_SECRET', 'change-me-in-prod')
 JWT_ALG = 'HS256'
 
 # Use marketplace.db for demo reports to avoid adding a new DB file
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'marketplace.db')
-
-
-def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        conn.execute(
-            '''CREATE TABLE IF NOT EXISTS certification_reports (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id TEXT,
-                crop_name TEXT,
-                reason TEXT,
-                details TEXT,
-                reporter_sub TEXT,
-                created_at TEXT NOT NULL
-            )'''
-        )
-        conn.commit()
-    finally:
-        conn.close()
-
-
-init_db()
+DB_PATH = MARKETPLACE_DB
 
 
 def token_from_header():
@@ -116,8 +94,7 @@ def report():
     reason = (body.get('reason') or '').strip() or 'Suspicious product'
     details = (body.get('details') or '').strip()
 
-    conn = sqlite3.connect(DB_PATH)
-    try:
+    with connect(DB_PATH) as conn:
         created_at = datetime.now(timezone.utc).isoformat()
         conn.execute(
             'INSERT INTO certification_reports (product_id, crop_name, reason, details, reporter_sub, created_at) VALUES (?, ?, ?, ?, ?, ?)',
@@ -125,8 +102,6 @@ def report():
         )
         conn.commit()
         return jsonify({'success': True, 'created_at': created_at})
-    finally:
-        conn.close()
 
 
 @certification_bp.route('/reports', methods=['GET'])
@@ -136,9 +111,12 @@ def list_reports():
     if err:
         return err
 
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        cur = conn.execute('SELECT id, product_id, crop_name, reason, details, reporter_sub, created_at FROM certification_reports ORDER BY datetime(created_at) DESC')
+    return versioned_json('certification_reports', _list_reports)
+
+
+def _list_reports():
+    with connect(DB_PATH) as conn:
+        cur = conn.execute('SELECT id, product_id, crop_name, reason, details, reporter_sub, created_at FROM certification_reports ORDER BY created_at DESC, id DESC')
         rows = cur.fetchall()
         items = []
         for r in rows:
@@ -151,6 +129,4 @@ def list_reports():
                 'reporter_sub': r[5],
                 'created_at': r[6],
             })
-        return jsonify(items)
-    finally:
-        conn.close()
\ No newline at end of file
+        return jsonify(items)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
-from services.gemini_service import ask_gemini
+from services.gemini_service import ask_gemini, ask_gemini_stream
+from routes.sse import wants_stream, sse_response, stream_answer
 
 chatbot_bp = Blueprint('chatbot', __name__)
 
@@ -16,5 +17,8 @@ def chatbot():
         f"Answer this as a farming assistant in 1-3 short, clear sentences. No intro or outro, just the answer.\n"
         f"Question: {message}"
     )
+    # Stream tokens as Server-Sent Events when requested; JSON otherwise
+    if wants_stream(request, data):
+        return sse_response(stream_answer(ask_gemini_stream(prompt, language=language)), '/api/chatbot/')
     answer = ask_gemini(prompt, language=language)
     return jsonify({'answer': answer})
@@ -0,0 +1,94 @@
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, request, jsonify
+
+from models.db import table_versions, MARKETPLACE_DB
+
+# Serialized response bodies per URL, valid while their table's version is unchanged (this worker)
+RESPONSE_CACHE_ENTRIES = int(os.getenv('RESPONSE_CACHE_ENTRIES', '512'))
+RESPONSE_CACHE_MAX_MB = float(os.getenv('RESPONSE_CACHE_MAX_MB', '32'))
+
+_bodies = OrderedDict()
+_bodies_bytes = 0
+_bodies_lock = threading.Lock()
+_stats = {'not_modified': 0, 'hits': 0, 'misses': 0}
+
+
+def _remember(key, entry):
+    global _bodies_bytes
+    with _bodies_lock:
+        old = _bodies.pop(key, None)
+        if old:
+            _bodies_bytes -= len(old[1])
+        _bodies[key] = entry
+        _bodies_bytes += len(entry[1])
+        while _bodies and (len(_bodies) > RESPONSE_CACHE_ENTRIES or _bodies_bytes > RESPONSE_CACHE_MAX_MB * 1024 * 1024):
+            _, evicted = _bodies.popitem(last=False)
+            _bodies_bytes -= len(evicted[1])
+
+
+def _count(stat):
+    with _bodies_lock:
+        _stats[stat] += 1
+
+
+def _recall(key, version):
+    with _bodies_lock:
+        entry = _bodies.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        _bodies.move_to_end(key)
+        return entry
+
+
+def versioned_json(table, build, path=MARKETPLACE_DB):
+    """
+    Serve a read endpoint from its table's version counter. The ETag is derived from
+    (URL, version), so If-None-Match / If-Modified-Since get a 304 before any query or
+    JSON encoding; otherwise a body serialized earlier for the same version is reused
+    and build() (returning data or a JSON response, optionally with a status) runs only
+    after a write.
+    """
+    version, updated_at = table_versions(path)[table]
+    key = request.full_path
+    etag = f'{table}-{version}-{zlib.crc32(key.encode("utf-8")):08x}'
+    last_modified = datetime.strptime(updated_at, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    # updated_at has one-second resolution: while its second is still current, another write
+    # could land under the same stamp, so only advertise (and honour) it once that second is over
+    settled = last_modified < datetime.now(timezone.utc).replace(microsecond=0)
+    if settled:
+        headers['Last-Modified'] = last_modified.strftime('%a, %d %b %Y %H:%M:%S GMT')
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        since = request.if_modified_since
+        fresh = settled and since is not None and last_modified <= since
+    if fresh:
+        _count('not_modified')
+        return '', 304, headers
+
+    entry = _recall(key, version)
+    if entry is None:
+        _count('misses')
+        result = build()
+        body, status = result if isinstance(result, tuple) else (result, 200)
+        if not isinstance(body, Response):
+            body = jsonify(body)
+        entry = (version, body.get_data(), status)
+        _remember(key, entry)
+    else:
+        _count('hits')
+    if entry[2] != 200:
+        return entry[1], entry[2], {'Content-Type': 'application/json'}
+    return entry[1], 200, dict(headers, **{'Content-Type': 'application/json'})
+
+
+def get_response_cache_stats():
+    with _bodies_lock:
+        return dict(_stats, entries=len(_bodies), bytes=_bodies_bytes)
@@ -1,10 +1,26 @@
 from flask import Blueprint, request, jsonify
 import os
+import time
+from datetime import datetime
+from concurrent.futures import TimeoutError as FuturesTimeout
 from dotenv import load_dotenv
-from services.crop_prices_service import get_real_crop_prices, get_popular_crops, get_market_insights
+from services.crop_prices_service import get_crop_prices_swr, get_fallback_prices, get_popular_crops, get_market_insights, fanout_pool, iter_price_matrix
+from services.price_history import get_price_history, BUCKETS
+from services.crop_taxonomy import canonical_crop
+from services.gazetteer import canonical_location
+from services.geocoder import market_location
+from routes.sse import wants_stream, sse_event, sse_response
 
 load_dotenv()
 
+# Per-branch deadlines (seconds from request start) for /get-prices
+PRICES_DEADLINE_SECONDS = float(os.getenv('PRICES_DEADLINE_SECONDS', '45'))
+INSIGHTS_DEADLINE_SECONDS = float(os.getenv('INSIGHTS_DEADLINE_SECONDS', '10'))
+
+# Bulk matrix limits: cells per request and the global deadline (clients may ask for less)
+BULK_MAX_CELLS = int(os.getenv('BULK_MAX_CELLS', '100'))
+BULK_DEADLINE_SECONDS = float(os.getenv('BULK_DEADLINE_SECONDS', '25'))
+
 crop_prices_bp = Blueprint('crop_prices', __name__)
 
 @crop_prices_bp.route('/get-prices', methods=['POST'])
@@ -20,24 +36,44 @@ def get_crop_prices():
                 'message': 'Location and crop name are required'
             }), 400
         
-        # Fetch real-time crop prices using Gemini API
+        # Prices and insights are independent Gemini calls: run them concurrently.
+        # Stale-while-revalidate: known keys answer from cache at once (stale ones flagged
+        # pending and refreshed in the background). Unseen keys block on Gemini unless the
+        # client opts into swr, in which case it gets pending fallback prices and polls.
+        swr = data.get('swr') is True or request.args.get('swr') in ('1', 'true')
+        started = time.monotonic()
+        prices_future = fanout_pool.submit(get_crop_prices_swr, location, crop_name, swr)
+        insights_future = fanout_pool.submit(get_market_insights, crop_name, location)
         try:
-            prices_data = get_real_crop_prices(location, crop_name)
+            prices_data, _state = prices_future.result(timeout=PRICES_DEADLINE_SECONDS)
+        except FuturesTimeout:
+            # The fetch keeps running and fills the cache for the next poll
+            prices_data = get_fallback_prices(location, crop_name, pending=True)
         except Exception:
             # Graceful fallback if Gemini fails
-            from services.crop_prices_service import get_fallback_prices
             prices_data = get_fallback_prices(location, crop_name)
         
-        # Get market insights
+        # Get market insights within what is left of their deadline
+        remaining = max(0.0, INSIGHTS_DEADLINE_SECONDS - (time.monotonic() - started))
         try:
-            insights = get_market_insights(crop_name, location)
+            insights = insights_future.result(timeout=remaining)
             if prices_data.get('success') and prices_data.get('data'):
                 prices_data['data']['market_insights'] = insights
+        except FuturesTimeout:
+            # Partial result: insights are cached when they arrive
+            if prices_data.get('success') and prices_data.get('data'):
+                prices_data['data']['partial'] = True
+                prices_data['data']['insights_pending'] = True
         except:
             # If insights fail, continue without them
             pass
         
-        return jsonify(prices_data)
+        # Pollers send If-None-Match and get 304 until the refreshed data lands
+        response = jsonify(prices_data)
+        response.add_etag()
+        if request.if_none_match.contains(response.get_etag()[0]):
+            return '', 304, {'ETag': response.headers['ETag']}
+        return response
         
     except Exception as e:
         return jsonify({
@@ -45,6 +81,120 @@ def get_crop_prices():
             'message': f'Error fetching crop prices: {str(e)}'
         }), 500
 
+def _unique_names(values, canonical):
+    """Drop blanks and entries naming the same crop/place as an earlier one."""
+    names, seen = [], set()
+    for value in values if isinstance(values, list) else []:
+        name = str(value or '').strip()
+        if name and canonical(name) not in seen:
+            seen.add(canonical(name))
+            names.append(name)
+    return names
+
+@crop_prices_bp.route('/bulk', methods=['POST'])
+def get_bulk_prices():
+    """
+    Price matrix for many crops x locations: {"crops": [...], "locations": [...], "deadline": secs}.
+    Cached cells are served at once, misses fetched concurrently; every cell carries a
+    status (fresh/stale/fallback/error). Streams one `cell` event per cell when requested.
+    """
+    data = request.get_json(silent=True) or {}
+    crops = _unique_names(data.get('crops'), canonical_crop)
+    locations = _unique_names(data.get('locations'), canonical_location)
+    if not crops or not locations:
+        return jsonify({
+            'success': False,
+            'message': 'crops and locations must be non-empty lists'
+        }), 400
+    if len(crops) * len(locations) > BULK_MAX_CELLS:
+        return jsonify({
+            'success': False,
+            'message': f'At most {BULK_MAX_CELLS} crop x location cells per request'
+        }), 400
+    try:
+        deadline = min(float(data.get('deadline') or BULK_DEADLINE_SECONDS), BULK_DEADLINE_SECONDS)
+    except (TypeError, ValueError):
+        deadline = BULK_DEADLINE_SECONDS
+
+    def cell(crop_name, location, status, prices_data):
+        return {
+            'crop_name': crop_name,
+            'location': location,
+            'row': crops.index(crop_name),
+            'col': locations.index(location),
+            'status': status,
+            'data': (prices_data or {}).get('data'),
+            'error': (prices_data or {}).get('error'),
+        }
+
+    if wants_stream(request, data):
+        def events():
+            counts = {}
+            for crop_name, location, status, prices_data in iter_price_matrix(crops, locations, deadline):
+                counts[status] = counts.get(status, 0) + 1
+                yield sse_event(cell(crop_name, location, status, prices_data), event='cell')
+            yield sse_event({'crops': crops, 'locations': locations, 'counts': counts}, event='done')
+        return sse_response(events(), '/api/crop-prices/bulk')
+
+    matrix = [[None] * len(locations) for _ in crops]
+    counts = {}
+    for crop_name, location, status, prices_data in iter_price_matrix(crops, locations, deadline):
+        counts[status] = counts.get(status, 0) + 1
+        item = cell(crop_name, location, status, prices_data)
+        matrix[item['row']][item['col']] = item
+    return jsonify({
+        'success': True,
+        'crops': crops,
+        'locations': locations,
+        'counts': counts,
+        'matrix': matrix
+    })
+
+@crop_prices_bp.route('/history', methods=['GET'])
+def get_price_history_route():
+    """Stored mandi price history: ?crop_name=&location=&start=&end=&bucket=daily|weekly|raw&mandi="""
+    crop_name = (request.args.get('crop_name') or '').strip()
+    location = (request.args.get('location') or '').strip()
+    start = request.args.get('start')
+    end = request.args.get('end')
+    bucket = request.args.get('bucket', 'daily')
+    mandi = request.args.get('mandi')
+
+    if not location or not crop_name:
+        return jsonify({
+            'success': False,
+            'message': 'Location and crop name are required'
+        }), 400
+    if bucket not in BUCKETS:
+        return jsonify({
+            'success': False,
+            'message': f"bucket must be one of {', '.join(BUCKETS)}"
+        }), 400
+    for value in (start, end):
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'message': 'start and end must be YYYY-MM-DD'
+                }), 400
+
+    try:
+        points = get_price_history(crop_name, market_location(location, cached_only=True), start=start, end=end, bucket=bucket, mandi=mandi)
+        return jsonify({
+            'success': True,
+            'crop_name': crop_name,
+            'location': location,
+            'bucket': bucket,
+            'points': points
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error fetching price history: {str(e)}'
+        }), 500
+
 @crop_prices_bp.route('/popular-crops', methods=['GET'])
 def get_popular_crops_route():
     """Get list of popular crops for the dropdown"""
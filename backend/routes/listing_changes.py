@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+
+from flask import Blueprint, request, jsonify
+
+from models.db import connect, get_conn, MARKETPLACE_DB
+from routes.sse import sse_event, sse_response
+
+listing_changes_bp = Blueprint('listing_changes', __name__)
+
+DB_PATH = MARKETPLACE_DB
+
+# Live listing changes (create/delete/verify) from the listing_changes log
+CHANGES_PAGE_SIZE = int(os.getenv('CHANGES_PAGE_SIZE', '500'))
+# Each stream holds a gthread slot: cap them per worker and end them so clients reconnect
+CHANGES_MAX_STREAMS = int(os.getenv('CHANGES_MAX_STREAMS', '2'))
+CHANGES_STREAM_MAX_SECONDS = int(os.getenv('CHANGES_STREAM_MAX_SECONDS', '300'))
+CHANGES_POLL_SECONDS = float(os.getenv('CHANGES_POLL_SECONDS', '1'))
+CHANGES_HEARTBEAT_SECONDS = int(os.getenv('CHANGES_HEARTBEAT_SECONDS', '15'))
+CHANGES_RETRY_MS = int(os.getenv('CHANGES_RETRY_MS', '3000'))
+
+_stream_slots = threading.BoundedSemaphore(CHANGES_MAX_STREAMS)
+
+
+def change_to_dict(row):
+    return {
+        'seq': row[0],
+        'listing_id': row[1],
+        'op': row[2],
+        'changed_at': row[3],
+        'listing': json.loads(row[4]),
+    }
+
+
+def log_bounds(conn):
+    """(oldest retained seq, latest seq); (None, 0) for an empty log."""
+    oldest, latest = conn.execute('SELECT MIN(seq), MAX(seq) FROM listing_changes').fetchone()
+    return oldest, latest or 0
+
+
+def changes_after(conn, since, limit):
+    cur = conn.execute(
+        'SELECT seq, listing_id, op, changed_at, data FROM listing_changes WHERE seq > ? ORDER BY seq LIMIT ?',
+        (since, limit)
+    )
+    return cur.fetchall()
+
+
+def is_expired(since, oldest):
+    """True when events after `since` were pruned, so the client must reload the feed."""
+    return oldest is not None and since < oldest - 1
+
+
+def parse_since(value):
+    if value in (None, ''):
+        return None
+    since = int(value)
+    if since < 0:
+        raise ValueError
+    return since
+
+
+@listing_changes_bp.route('/', methods=['GET'])
+def list_changes():
+    """
+    Changes after ?since=<seq> (oldest first, up to limit) with next_since to resume from.
+    Without since this only returns the latest seq: fetch it, load the feed, then follow
+    from there. 410 with reset=true when since predates the retained log.
+    """
+    try:
+        since = parse_since(request.args.get('since'))
+        limit = min(max(1, int(request.args.get('limit', CHANGES_PAGE_SIZE))), CHANGES_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be non-negative integers'}), 400
+
+    with connect(DB_PATH) as conn:
+        oldest, latest = log_bounds(conn)
+        if since is None:
+            return jsonify({'changes': [], 'next_since': latest, 'latest': latest})
+        if is_expired(since, oldest):
+            return jsonify({'error': 'since is older than the retained change log', 'reset': True, 'latest': latest}), 410
+        rows = changes_after(conn, since, limit)
+    changes = [change_to_dict(r) for r in rows]
+    return jsonify({
+        'changes': changes,
+        'next_since': changes[-1]['seq'] if changes else since,
+        'latest': latest,
+    })
+
+
+def _follow(since):
+    """
+    SSE generator: backlog after `since` in pages of CHANGES_PAGE_SIZE, then new events as
+    commits land (checked through PRAGMA data_version every CHANGES_POLL_SECONDS). Event ids
+    are seqs, so EventSource resumes with Last-Event-ID after the reconnect at the time limit.
+    """
+    conn = get_conn(DB_PATH)
+    started = last_sent = time.monotonic()
+    stamp = None
+    yield f'retry: {CHANGES_RETRY_MS}\n\n'
+    while time.monotonic() - started < CHANGES_STREAM_MAX_SECONDS:
+        current = (conn.execute('PRAGMA data_version').fetchone()[0], conn.total_changes)
+        if current != stamp:
+            stamp = current
+            oldest, latest = log_bounds(conn)
+            if since is None:
+                since = latest
+            if is_expired(since, oldest):
+                yield sse_event({'reset': True, 'latest': latest}, event='reset')
+                return
+            while True:
+                rows = changes_after(conn, since, CHANGES_PAGE_SIZE)
+                for row in rows:
+                    change = change_to_dict(row)
+                    yield sse_event(change, event=change['op'], event_id=change['seq'])
+                    since = change['seq']
+                    last_sent = time.monotonic()
+                if len(rows) < CHANGES_PAGE_SIZE:
+                    break
+        if time.monotonic() - last_sent >= CHANGES_HEARTBEAT_SECONDS:
+            # Comment line: keeps proxies from timing out and surfaces dead clients on write
+            yield ': ping\n\n'
+            last_sent = time.monotonic()
+        time.sleep(CHANGES_POLL_SECONDS)
+    yield sse_event({'since': since}, event='reconnect')
+
+
+@listing_changes_bp.route('/stream', methods=['GET'])
+def stream_changes():
+    """
+    Server-Sent Events of listing changes (events: create, delete, verify, unverify).
+    Resumes after the Last-Event-ID header or ?since=<seq>; starts at the latest seq
+    otherwise. Streams end after CHANGES_STREAM_MAX_SECONDS and clients reconnect.
+    """
+    try:
+        since = parse_since(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    except ValueError:
+        return jsonify({'error': 'since must be a non-negative integer'}), 400
+    if not _stream_slots.acquire(blocking=False):
+        return jsonify({'error': 'too many change streams', 'poll': '/api/marketplace/changes/?since=<seq>'}), 503, {'Retry-After': str(CHANGES_RETRY_MS // 1000 or 1)}
+    response = sse_response(_follow(since), 'listing-changes')
+    # Also runs when the client disconnects before the generator starts
+    response.call_on_close(_stream_slots.release)
+    return response
@@ -0,0 +1,31 @@
+from flask import Blueprint, request, jsonify
+from services.gazetteer import resolve, suggest
+
+locations_bp = Blueprint('locations', __name__)
+
+@locations_bp.route('/suggest', methods=['GET'])
+def suggest_locations():
+    """
+    Prefix suggestions from the local gazetteer: ?q=beng&limit=10
+    """
+    q = (request.args.get('q') or '').strip()
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+    if not q:
+        return jsonify([])
+    return jsonify([place.to_dict() for place in suggest(q, limit)])
+
+@locations_bp.route('/resolve', methods=['GET'])
+def resolve_location():
+    """
+    Canonical place for free-text input (aliases, "district, state", small typos): ?q=Bangalore
+    """
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+    place = resolve(q)
+    if not place:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(place.to_dict())
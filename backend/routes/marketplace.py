@@ -1,17 +1,44 @@
-from flask import Blueprint, request, jsonify
-import sqlite3
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 import os
+import json
+import base64
+import csv
+import io
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
 from datetime import datetime
 import jwt
+import numpy as np
+from services.crop_taxonomy import crop_id as canonical_crop_id, children as taxonomy_children, display_crop, normalize as normalize_crop_text
+from services.geocoder import geocode
+from services.gazetteer import coordinates
+from models.db import connect, MARKETPLACE_DB
+from routes.conditional import versioned_json
 
 marketplace_bp = Blueprint('marketplace', __name__)
 
 # Database path within backend folder
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'marketplace.db')
+DB_PATH = MARKETPLACE_DB
 
 JWT_SECRET = os.getenv('JWT_SECRET', 'change-me-in-prod')
 JWT_ALG = 'HS256'
 
+# Keyset-paginated feed (GET /?limit=&cursor=...)
+MARKETPLACE_PAGE_SIZE = int(os.getenv('MARKETPLACE_PAGE_SIZE', '50'))
+MARKETPLACE_MAX_PAGE_SIZE = int(os.getenv('MARKETPLACE_MAX_PAGE_SIZE', '200'))
+# /search: buckets returned per facet
+SEARCH_FACET_SIZE = int(os.getenv('SEARCH_FACET_SIZE', '10'))
+# /nearby: default and maximum search radius (km)
+NEARBY_RADIUS_KM = float(os.getenv('NEARBY_RADIUS_KM', '50'))
+NEARBY_MAX_RADIUS_KM = float(os.getenv('NEARBY_MAX_RADIUS_KM', '500'))
+KM_PER_DEGREE = 111.32
+# POST /bulk: rows per executemany transaction, rows per request
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '500'))
+BULK_MAX_ROWS = int(os.getenv('BULK_MAX_ROWS', '100000'))
+
 def token_from_header():
     auth = request.headers.get('Authorization') or ''
     if auth.lower().startswith('bearer '):
@@ -28,46 +55,6 @@ def require_auth_payload():
     except Exception:
         return None, (jsonify({'error': 'Invalid token'}), 401)
 
-# Ensure DB and table exist
-def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        conn.execute(
-            '''CREATE TABLE IF NOT EXISTS listings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                crop_name TEXT NOT NULL,
-                quantity TEXT NOT NULL,
-                price REAL NOT NULL,
-                location TEXT NOT NULL,
-                contact TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )'''
-        )
-        # Migrations: add owner/verification columns if missing
-        try:
-            conn.execute('ALTER TABLE listings ADD COLUMN owner_sub TEXT')
-        except Exception:
-            pass
-        try:
-            conn.execute('ALTER TABLE listings ADD COLUMN verified_by_superuser INTEGER DEFAULT 0')
-        except Exception:
-            pass
-        try:
-            conn.execute('ALTER TABLE listings ADD COLUMN verified_at TEXT')
-        except Exception:
-            pass
-        try:
-            conn.execute('ALTER TABLE listings ADD COLUMN verified_by_sub TEXT')
-        except Exception:
-            pass
-        conn.commit()
-    finally:
-        conn.close()
-
-init_db()
-
-
 def row_to_dict(row):
     return {
         'id': row[0],
@@ -77,54 +64,411 @@ def row_to_dict(row):
         'location': row[4],
         'contact': row[5],
         'created_at': row[6],
+        'crop_id': row[7],
+    }
+
+LISTING_COLUMNS = 'id, crop_name, quantity, price, location, contact, created_at, owner_sub, verified_by_superuser, verified_at, verified_by_sub, crop_id, lat, lon'
+
+def listing_to_dict(r):
+    return {
+        'id': r[0],
+        'crop_name': r[1],
+        'quantity': r[2],
+        'price': r[3],
+        'location': r[4],
+        'contact': r[5],
+        'created_at': r[6],
+        'owner_sub': r[7],
+        'verified_by_superuser': bool(r[8] or 0),
+        'verified_at': r[9],
+        'verified_by_sub': r[10],
+        'crop_id': r[11],
+        'lat': r[12],
+        'lon': r[13],
     }
 
+def encode_cursor(created_at, item_id):
+    raw = json.dumps([created_at, item_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """(created_at, id) of the last row on the previous page; ValueError when malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+    except Exception:
+        raise ValueError('invalid cursor')
+    if not isinstance(created_at, str) or not isinstance(item_id, int):
+        raise ValueError('invalid cursor')
+    return created_at, item_id
+
+def parse_feed_args(args):
+    """
+    Validate the feed query string into (where clauses, params, limit, errors).
+    Equality filters match the leading column of an (x, created_at, id) index, so
+    the keyset order is served from the index; the price range is checked per row.
+    """
+    where, params, errors = [], [], []
+    try:
+        limit = int(args.get('limit', MARKETPLACE_PAGE_SIZE))
+        limit = min(max(1, limit), MARKETPLACE_MAX_PAGE_SIZE)
+    except ValueError:
+        errors.append('limit must be an integer')
+        limit = MARKETPLACE_PAGE_SIZE
+
+    crop = (args.get('crop') or '').strip()
+    if crop:
+        crop_id = canonical_crop_id(crop)
+        if crop_id:
+            # Same taxonomy expansion as /search: "pulses" also matches tur and moong listings
+            crop_ids = taxonomy_children(crop_id)
+            if len(crop_ids) == 1:
+                where.append('crop_id = ?')
+            else:
+                where.append(f"crop_id IN ({', '.join('?' * len(crop_ids))})")
+            params.extend(crop_ids)
+        else:
+            # Not in the taxonomy: only listings saved under exactly this name
+            where.append('crop_id IS NULL AND crop_name = ? COLLATE NOCASE')
+            params.append(crop)
+    location = (args.get('location') or '').strip()
+    if location:
+        where.append('location = ? COLLATE NOCASE')
+        params.append(location)
+    owner = (args.get('owner') or '').strip()
+    if owner:
+        where.append('owner_sub = ?')
+        params.append(owner)
+    verified = (args.get('verified') or '').strip().lower()
+    if verified:
+        if verified in ('1', 'true', 'yes'):
+            where.append('verified_by_superuser = 1')
+        elif verified in ('0', 'false', 'no'):
+            where.append('verified_by_superuser = 0')
+        else:
+            errors.append('verified must be true or false')
+    for name, op in (('min_price', '>='), ('max_price', '<=')):
+        value = args.get(name)
+        if value not in (None, ''):
+            try:
+                params.append(float(value))
+                where.append(f'price {op} ?')
+            except ValueError:
+                errors.append(f'{name} must be a number')
+    cursor = args.get('cursor')
+    if cursor:
+        try:
+            where.append('(created_at, id) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+        except ValueError as e:
+            errors.append(str(e))
+    return where, params, limit, errors
+
 @marketplace_bp.route('/', methods=['GET'])
 def list_listings():
-    conn = sqlite3.connect(DB_PATH)
+    """
+    Newest-first listings. Without query parameters this is the legacy full array;
+    any of limit, cursor, crop, location, min_price, max_price, verified or owner
+    returns one keyset page as {"items": [...], "next_cursor": "..." | null}.
+    Conditional and cached per listings version.
+    """
+    return versioned_json('listings', _list_listings)
+
+def _list_listings():
+    if not request.args:
+        with connect(DB_PATH) as conn:
+            cur = conn.execute(f'SELECT {LISTING_COLUMNS} FROM listings ORDER BY created_at DESC, id DESC')
+            rows = cur.fetchall()
+            return jsonify([listing_to_dict(r) for r in rows])
+
+    where, params, limit, errors = parse_feed_args(request.args)
+    if errors:
+        return jsonify({'error': 'Validation failed', 'details': errors}), 400
+
+    sql = f'SELECT {LISTING_COLUMNS} FROM listings'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+    with connect(DB_PATH) as conn:
+        # One extra row tells us whether another page exists
+        rows = conn.execute(sql, params + [limit + 1]).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1][6], rows[limit - 1][0]) if len(rows) > limit else None
+    return jsonify({'items': [listing_to_dict(r) for r in rows[:limit]], 'next_cursor': next_cursor})
+
+# Words that shape a search rather than match listing text ("basmati near Karnal under 3000")
+SEARCH_STOPWORDS = {'a', 'an', 'the', 'of', 'for', 'from', 'with', 'and', 'rs', 'inr', 'rupees', '₹'}
+SEARCH_LOCATION_WORDS = {'near', 'in', 'at', 'around'}
+SEARCH_MAX_PRICE_WORDS = {'under', 'below', 'upto', 'max', 'within'}
+SEARCH_MIN_PRICE_WORDS = {'over', 'above', 'min', 'from'}
+# bm25 weights per listings_fts column: crop_name, location, quantity, crop_id
+SEARCH_BM25_WEIGHTS = '10.0, 4.0, 1.0, 8.0'
+
+def _price_word(word):
     try:
-        cur = conn.execute('SELECT id, crop_name, quantity, price, location, contact, created_at, owner_sub, verified_by_superuser, verified_at, verified_by_sub FROM listings ORDER BY datetime(created_at) DESC')
-        rows = cur.fetchall()
-        return jsonify([{
-            'id': r[0],
-            'crop_name': r[1],
-            'quantity': r[2],
-            'price': r[3],
-            'location': r[4],
-            'contact': r[5],
-            'created_at': r[6],
-            'owner_sub': r[7],
-            'verified_by_superuser': bool(r[8] or 0),
-            'verified_at': r[9],
-            'verified_by_sub': r[10],
-        } for r in rows])
-    finally:
-        conn.close()
+        return float(word.lstrip('₹'))
+    except ValueError:
+        return None
+
+def _fts_term(word, column=None):
+    term = f'"{word}"*'
+    if column:
+        return f'{column} : {term}'
+    crop = canonical_crop_id(word)
+    if not crop:
+        return term
+    # "chawal" also finds listings saved as Rice or Basmati Rice via their crop_id
+    ids = ' OR '.join(f'"{c}"' for c in taxonomy_children(crop))
+    return f'({term} OR crop_id : ({ids}))'
+
+def parse_search_query(q):
+    """
+    Split a free-text search into an FTS5 MATCH expression plus price bounds.
+    "near|in|at X" searches X in the location column; "under|below N" and
+    "over|above N" (or "between N and M") become max_price/min_price.
+    """
+    words = normalize_crop_text(re.sub(r'(?<=\d),(?=\d)', '', q or '')).split()
+    terms, min_price, max_price = [], None, None
+    i = 0
+    while i < len(words):
+        word = words[i]
+        following = words[i + 1] if i + 1 < len(words) else None
+        if word == 'between' and following and i + 3 < len(words) and words[i + 2] in ('and', 'to'):
+            low, high = _price_word(following), _price_word(words[i + 3])
+            if low is not None and high is not None:
+                min_price, max_price = min(low, high), max(low, high)
+                i += 4
+                continue
+        if word in SEARCH_MAX_PRICE_WORDS | SEARCH_MIN_PRICE_WORDS and following and _price_word(following) is not None:
+            if word in SEARCH_MAX_PRICE_WORDS:
+                max_price = _price_word(following)
+            else:
+                min_price = _price_word(following)
+            i += 2
+            continue
+        if word in SEARCH_LOCATION_WORDS and following and following not in SEARCH_STOPWORDS:
+            terms.append(_fts_term(following, 'location'))
+            i += 2
+            continue
+        if word not in SEARCH_STOPWORDS | SEARCH_LOCATION_WORDS:
+            terms.append(_fts_term(word.lstrip('₹') or word))
+        i += 1
+    return ' AND '.join(terms), min_price, max_price
+
+@marketplace_bp.route('/search', methods=['GET'])
+def search_listings():
+    """
+    Full-text listing search: ?q=basmati near Karnal under 3000&sort=relevance|recent
+    &limit=&offset= plus the feed filters (crop, location, min_price, max_price,
+    verified, owner). One statement returns the page, the total and the crop,
+    location and verified facets of every match.
+    """
+    return versioned_json('listings', _search_listings)
+
+def _search_listings():
+    args = request.args.to_dict()
+    args.pop('cursor', None)
+    match, q_min, q_max = parse_search_query(args.get('q'))
+    # Explicit price parameters win over prices read from the query text
+    if q_min is not None and not args.get('min_price'):
+        args['min_price'] = str(q_min)
+    if q_max is not None and not args.get('max_price'):
+        args['max_price'] = str(q_max)
+    where, params, limit, errors = parse_feed_args(args)
+    sort = (args.get('sort') or 'relevance').strip().lower()
+    if sort not in ('relevance', 'recent'):
+        errors.append('sort must be relevance or recent')
+    try:
+        offset = max(0, int(args.get('offset', 0)))
+    except ValueError:
+        errors.append('offset must be an integer')
+    if errors:
+        return jsonify({'error': 'Validation failed', 'details': errors}), 400
+
+    # bm25 is the expensive part of a broad match, so recency sorts skip it
+    score = f'bm25(listings_fts, {SEARCH_BM25_WEIGHTS})' if sort == 'relevance' else '0.0'
+    if match:
+        # CROSS JOIN pins the FTS scan as the outer loop; with a plain JOIN the planner may
+        # drive from a filter index and re-run the MATCH once per listing
+        source = (f'(SELECT rowid AS hit_id, {score} AS score FROM listings_fts WHERE listings_fts MATCH ?) AS m '
+                  'CROSS JOIN listings ON listings.id = m.hit_id')
+        params = [match] + params
+    else:
+        source = '(SELECT 0.0 AS score) AS m, listings'
+    order = 'score, created_at DESC, id DESC' if sort == 'relevance' else 'created_at DESC, id DESC'
+    # hits keeps only what ordering and facets need; the page joins back for full rows, and one
+    # GROUP BY over (crop, location, verified) yields every facet and the total in a single sort
+    sql = f'''
+        WITH hits AS MATERIALIZED (
+            SELECT id, created_at, COALESCE(crop_id, lower(crop_name)) AS crop_key, location,
+                   verified_by_superuser AS verified, score
+            FROM {source}
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+        )
+        SELECT 'item', {', '.join('listings.' + c.strip() for c in LISTING_COLUMNS.split(','))}, p.score
+            FROM (SELECT id, score FROM hits ORDER BY {order} LIMIT ? OFFSET ?) AS p
+            CROSS JOIN listings ON listings.id = p.id
+        UNION ALL SELECT 'facet', crop_key, MIN(location), verified, COUNT(*){', NULL' * 11}
+            FROM hits GROUP BY crop_key, location COLLATE NOCASE, verified
+    '''
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(sql, params + [limit, offset]).fetchall()
+
+    items, total = [], 0
+    crop_counts, location_counts, location_names = {}, {}, {}
+    verified_counts = {'true': 0, 'false': 0}
+    for r in rows:
+        if r[0] == 'item':
+            items.append(r)
+            continue
+        crop_key, location, verified, n = r[1], r[2], r[3], r[4]
+        total += n
+        crop_counts[crop_key] = crop_counts.get(crop_key, 0) + n
+        location_key = location.casefold()
+        location_counts[location_key] = location_counts.get(location_key, 0) + n
+        location_names.setdefault(location_key, location)
+        verified_counts['true' if verified else 'false'] += n
+    top_crops = sorted(crop_counts.items(), key=lambda kv: -kv[1])[:SEARCH_FACET_SIZE]
+    top_locations = sorted(location_counts.items(), key=lambda kv: -kv[1])[:SEARCH_FACET_SIZE]
+    facets = {
+        'crop': [{'value': k, 'name': display_crop(k), 'count': n} for k, n in top_crops],
+        'location': [{'value': location_names[k], 'count': n} for k, n in top_locations],
+        'verified': verified_counts,
+    }
+    # Stable sorts restore the page order independently of how UNION ALL emits rows
+    items.sort(key=lambda r: (r[7], r[1]), reverse=True)
+    if sort == 'relevance':
+        items.sort(key=lambda r: r[15])
+    next_offset = offset + limit if offset + limit < total else None
+    return jsonify({
+        'items': [dict(listing_to_dict(r[1:15]), score=(-r[15] if match and sort == 'relevance' else None)) for r in items],
+        'total': total,
+        'facets': facets,
+        'next_offset': next_offset,
+        'query': {'match': match, 'min_price': args.get('min_price'), 'max_price': args.get('max_price'), 'sort': sort},
+    })
+
+def distances_km(lat, lon, lats, lons):
+    """Haversine distance (km) from one point to arrays of points."""
+    p1, p2 = np.radians(lat), np.radians(lats)
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(np.radians(lons - lon) / 2) ** 2
+    return 12742 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def parse_nearby_area(args):
+    """
+    (center, bbox, radius_km, errors) for ?lat=&lon= or ?near=<place> with radius_km,
+    or ?bbox=min_lon,min_lat,max_lon,max_lat (distances from its center unless lat/lon given).
+    """
+    errors = []
+    center, bbox, radius_km = None, None, None
+    try:
+        if args.get('lat') not in (None, '') or args.get('lon') not in (None, ''):
+            center = (float(args.get('lat')), float(args.get('lon')))
+    except (TypeError, ValueError):
+        errors.append('lat and lon must be numbers')
+    near = (args.get('near') or '').strip()
+    if center is None and near:
+        center = geocode(near)
+        if center is None:
+            errors.append(f'unknown place: {near}')
+    if args.get('bbox'):
+        try:
+            min_lon, min_lat, max_lon, max_lat = [float(v) for v in args.get('bbox').split(',')]
+            if min_lat > max_lat or min_lon > max_lon:
+                raise ValueError
+            bbox = (min_lat, max_lat, min_lon, max_lon)
+            center = center or ((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)
+        except ValueError:
+            errors.append('bbox must be min_lon,min_lat,max_lon,max_lat')
+    elif center is not None:
+        try:
+            radius_km = float(args.get('radius_km', NEARBY_RADIUS_KM))
+            if not 0 < radius_km <= NEARBY_MAX_RADIUS_KM:
+                errors.append(f'radius_km must be between 0 and {NEARBY_MAX_RADIUS_KM:g}')
+        except ValueError:
+            errors.append('radius_km must be a number')
+        else:
+            dlat = radius_km / KM_PER_DEGREE
+            dlon = radius_km / (KM_PER_DEGREE * max(np.cos(np.radians(center[0])), 0.01))
+            bbox = (center[0] - dlat, center[0] + dlat, center[1] - dlon, center[1] + dlon)
+    if center is None and not errors:
+        errors.append('provide lat and lon, near, or bbox')
+    return center, bbox, radius_km, errors
+
+@marketplace_bp.route('/nearby', methods=['GET'])
+def nearby_listings():
+    """
+    Listings within radius_km of a point (or inside a bbox), nearest first:
+    ?lat=&lon=|near=Karnal &radius_km=50 |bbox=... &limit=&offset= plus the feed
+    filters (crop, location, min_price, max_price, verified, owner). The R*Tree
+    narrows candidates to the bounding box; only those are distance-ranked.
+    """
+    args = request.args.to_dict()
+    args.pop('cursor', None)
+    center, bbox, radius_km, errors = parse_nearby_area(args)
+    where, params, limit, feed_errors = parse_feed_args(args)
+    errors += feed_errors
+    try:
+        offset = max(0, int(args.get('offset', 0)))
+    except ValueError:
+        errors.append('offset must be an integer')
+    if errors:
+        return jsonify({'error': 'Validation failed', 'details': errors}), 400
+
+    sql = ('SELECT listings.id, listings.lat, listings.lon FROM listings_geo '
+           'CROSS JOIN listings ON listings.id = listings_geo.id '
+           'WHERE listings_geo.max_lat >= ? AND listings_geo.min_lat <= ? '
+           'AND listings_geo.max_lon >= ? AND listings_geo.min_lon <= ?')
+    if where:
+        sql += ' AND ' + ' AND '.join(where)
+    with connect(DB_PATH) as conn:
+        candidates = conn.execute(sql, list(bbox) + params).fetchall()
+        ids = np.array([c[0] for c in candidates], dtype=np.int64)
+        km = distances_km(center[0], center[1], np.array([c[1] for c in candidates], dtype=float), np.array([c[2] for c in candidates], dtype=float))
+        if radius_km is not None:
+            keep = km <= radius_km
+            ids, km = ids[keep], km[keep]
+        # Nearest first, id breaks ties so pages are stable
+        order = np.lexsort((ids, km))[offset:offset + limit]
+        page_ids = [int(i) for i in ids[order]]
+        rows = {}
+        if page_ids:
+            cur = conn.execute(f'SELECT {LISTING_COLUMNS} FROM listings WHERE id IN ({", ".join("?" * len(page_ids))})', page_ids)
+            rows = {r[0]: r for r in cur.fetchall()}
+    items = [dict(listing_to_dict(rows[i]), distance_km=round(float(d), 2)) for i, d in zip(page_ids, km[order]) if i in rows]
+    total = int(len(ids))
+    return jsonify({
+        'items': items,
+        'total': total,
+        'next_offset': offset + limit if offset + limit < total else None,
+        'center': {'lat': center[0], 'lon': center[1]},
+        'radius_km': radius_km,
+    })
 
 @marketplace_bp.route('/<int:item_id>', methods=['GET'])
 def get_listing(item_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        cur = conn.execute('SELECT id, crop_name, quantity, price, location, contact, created_at FROM listings WHERE id = ?', (item_id,))
+    return versioned_json('listings', lambda: _get_listing(item_id))
+
+def _get_listing(item_id):
+    with connect(DB_PATH) as conn:
+        cur = conn.execute('SELECT id, crop_name, quantity, price, location, contact, created_at, crop_id FROM listings WHERE id = ?', (item_id,))
         row = cur.fetchone()
         if not row:
             return jsonify({'error': 'Not found'}), 404
         return jsonify(row_to_dict(row))
-    finally:
-        conn.close()
 
-@marketplace_bp.route('/', methods=['POST'])
-def create_listing():
-    payload, err = require_auth_payload()
-    if err:
-        return err
+LISTING_INSERT = ('INSERT INTO listings (crop_name, quantity, price, location, contact, created_at, owner_sub, verified_by_superuser, verified_at, verified_by_sub, crop_id, lat, lon) '
+                  'VALUES (?, ?, ?, ?, ?, ?, ?, 0, NULL, NULL, ?, ?, ?)')
 
-    data = request.get_json(silent=True) or {}
-    crop_name = (data.get('crop_name') or '').strip()
-    quantity = (data.get('quantity') or '').strip()
+def validate_listing(data):
+    """
+    Validation shared by create_listing and the bulk import: returns (fields, errors), where
+    fields holds the cleaned crop_name, quantity, price, location, contact, lat and lon.
+    """
+    crop_name = str(data.get('crop_name') or '').strip()
+    quantity = str(data.get('quantity') or '').strip()
     price = data.get('price')
-    location = (data.get('location') or '').strip()
-    contact = (data.get('contact') or '').strip()
+    location = str(data.get('location') or '').strip()
+    contact = str(data.get('contact') or '').strip()
 
     # Basic validation
     errors = []
@@ -140,23 +484,169 @@ def create_listing():
         errors.append('location is required')
     if not contact:
         errors.append('contact is required')
+    # Optional device coordinates; otherwise the caller resolves the location
+    lat, lon = data.get('lat'), data.get('lon')
+    if lat not in (None, '') or lon not in (None, ''):
+        try:
+            lat, lon = float(lat), float(lon)
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append('lat and lon must be valid coordinates')
+    else:
+        lat = lon = None
+    return {'crop_name': crop_name, 'quantity': quantity, 'price': price, 'location': location,
+            'contact': contact, 'lat': lat, 'lon': lon}, errors
 
+@marketplace_bp.route('/', methods=['POST'])
+def create_listing():
+    payload, err = require_auth_payload()
+    if err:
+        return err
+
+    fields, errors = validate_listing(request.get_json(silent=True) or {})
     if errors:
         return jsonify({'error': 'Validation failed', 'details': errors}), 400
 
+    crop_name, quantity, price, location, contact = (fields[k] for k in ('crop_name', 'quantity', 'price', 'location', 'contact'))
     created_at = datetime.utcnow().isoformat()
+    crop_id = canonical_crop_id(crop_name)
+    # Geocoded once (gazetteer, then the persistent geocode cache) unless the device sent coordinates
+    lat, lon = fields['lat'], fields['lon']
+    if lat is None:
+        lat, lon = geocode(location) or (None, None)
 
-    conn = sqlite3.connect(DB_PATH)
-    try:
+    with connect(DB_PATH) as conn:
         cur = conn.execute(
-            'INSERT INTO listings (crop_name, quantity, price, location, contact, created_at, owner_sub, verified_by_superuser, verified_at, verified_by_sub) VALUES (?, ?, ?, ?, ?, ?, ?, 0, NULL, NULL)',
-            (crop_name, quantity, price, location, contact, created_at, str(payload.get('sub')) if payload else None)
+            LISTING_INSERT,
+            (crop_name, quantity, price, location, contact, created_at, str(payload.get('sub')) if payload else None, crop_id, lat, lon)
         )
         conn.commit()
         new_id = cur.lastrowid
-        return jsonify({'id': new_id, 'crop_name': crop_name, 'quantity': quantity, 'price': price, 'location': location, 'contact': contact, 'created_at': created_at, 'owner_sub': str(payload.get('sub'))}), 201
-    finally:
-        conn.close()
+        return jsonify({'id': new_id, 'crop_name': crop_name, 'quantity': quantity, 'price': price, 'location': location, 'contact': contact, 'created_at': created_at, 'owner_sub': str(payload.get('sub')), 'crop_id': crop_id, 'lat': lat, 'lon': lon}), 201
+
+def _bulk_records(stream, fmt):
+    """(row number, dict or None) per record of a CSV (header row) or NDJSON body, read incrementally."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None, errors='replace')
+    if fmt == 'csv':
+        for number, record in enumerate(csv.DictReader(text), start=1):
+            yield number, record
+        return
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+def _insert_batch(batch):
+    """Insert validated rows in one transaction; returns their ids (consecutive under the write lock)."""
+    with connect(DB_PATH) as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany(LISTING_INSERT, batch)
+        last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        conn.commit()
+    return range(last_id - len(batch) + 1, last_id + 1)
+
+def _bulk_import(records, owner_sub):
+    """
+    NDJSON result lines in input row order: each batch's validation errors and ids are
+    written together once the batch commits. Rows past BULK_MAX_ROWS are not imported
+    and are counted as skipped in the summary (truncated: true).
+    """
+    started = time.perf_counter()
+    created = failed = rows = skipped = 0
+    batch, results = [], []
+
+    def flush():
+        nonlocal created, failed
+        ids, error = iter(()), None
+        if batch:
+            try:
+                ids = iter(_insert_batch(batch))
+                created += len(batch)
+            except sqlite3.Error as e:
+                # The batch rolled back as a whole; earlier batches stay committed
+                failed += len(batch)
+                error = f'database error: {e}'
+        lines = []
+        for number, line in results:
+            if line is None:
+                line = json.dumps({'row': number, 'errors': [error]} if error else {'row': number, 'id': next(ids)})
+            lines.append(line + '\n')
+        batch.clear()
+        results.clear()
+        return ''.join(lines)
+
+    for number, record in records:
+        if rows >= BULK_MAX_ROWS:
+            skipped += 1
+            continue
+        rows += 1
+        if record is None:
+            failed += 1
+            results.append((number, json.dumps({'row': number, 'errors': ['invalid JSON object']})))
+        else:
+            fields, errors = validate_listing(record)
+            if errors:
+                failed += 1
+                results.append((number, json.dumps({'row': number, 'errors': errors})))
+            else:
+                # Offline coordinates only (gazetteer); a network geocode per row would cap throughput
+                lat, lon = fields['lat'], fields['lon']
+                if lat is None:
+                    lat, lon = coordinates(fields['location']) or (None, None)
+                batch.append((fields['crop_name'], fields['quantity'], fields['price'], fields['location'], fields['contact'],
+                              datetime.utcnow().isoformat(), owner_sub, canonical_crop_id(fields['crop_name']), lat, lon))
+                results.append((number, None))
+        if len(results) >= BULK_BATCH_SIZE:
+            yield flush()
+    if results:
+        yield flush()
+    elapsed = time.perf_counter() - started
+    print(f"[LOG] Bulk listing import rows={rows} created={created} failed={failed} skipped={skipped} seconds={elapsed:.2f}")
+    summary = {'rows': rows, 'created': created, 'failed': failed, 'skipped': skipped, 'truncated': skipped > 0,
+               'rows_per_second': round(rows / elapsed, 1) if elapsed else None}
+    if skipped:
+        summary['error'] = f'import is limited to {BULK_MAX_ROWS} rows; {skipped} more rows were not imported'
+    yield json.dumps({'summary': summary}) + '\n'
+
+@marketplace_bp.route('/bulk', methods=['POST'])
+def bulk_create_listings():
+    """
+    Import many listings from a streamed CSV (header: crop_name, quantity, price, location,
+    contact[, lat, lon]) or NDJSON body, chosen by Content-Type or ?format=csv|ndjson.
+    The body is spooled to a temporary file before any result is sent, so clients that
+    only read the response after finishing the upload never stall. Rows get
+    create_listing's validation and are inserted BULK_BATCH_SIZE at a time with
+    executemany. The response streams NDJSON in row order: {"row", "id"} or
+    {"row", "errors"} per row, then a {"summary"} line whose skipped/truncated fields
+    report rows beyond BULK_MAX_ROWS, so memory stays flat for any file size.
+    """
+    payload, err = require_auth_payload()
+    if err:
+        return err
+    fmt = (request.args.get('format') or '').lower()
+    if not fmt:
+        content_type = request.mimetype or ''
+        fmt = 'csv' if content_type in ('text/csv', 'application/csv') else 'ndjson' if 'ndjson' in content_type or 'jsonl' in content_type else ''
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Send text/csv or application/x-ndjson (or ?format=csv|ndjson)'}), 415
+
+    spool = tempfile.TemporaryFile()
+    try:
+        shutil.copyfileobj(request.stream, spool, 1024 * 1024)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    records = _bulk_records(spool, fmt)
+    owner_sub = str(payload.get('sub'))
+    response = Response(stream_with_context(_bulk_import(records, owner_sub)), mimetype='application/x-ndjson')
+    response.call_on_close(spool.close)
+    return response
 
 @marketplace_bp.route('/<int:item_id>', methods=['DELETE'])
 def delete_listing(item_id: int):
@@ -164,8 +654,7 @@ def delete_listing(item_id: int):
     if err:
         return err
 
-    conn = sqlite3.connect(DB_PATH)
-    try:
+    with connect(DB_PATH) as conn:
         cur = conn.execute('SELECT owner_sub FROM listings WHERE id = ?', (item_id,))
         row = cur.fetchone()
         if not row:
@@ -176,6 +665,4 @@ def delete_listing(item_id: int):
             return jsonify({'error': 'forbidden'}), 403
         cur = conn.execute('DELETE FROM listings WHERE id = ?', (item_id,))
         conn.commit()
-        return jsonify({'success': True})
-    finally:
-        conn.close()
\ No newline at end of file
+        return jsonify({'success': True})
\ No newline at end of file
@@ -1,11 +1,60 @@
 from flask import Blueprint, request, jsonify
 import os
-import requests
+import time
+import zlib
+import numpy as np
+from services.geocoder import geocode
+from services.ndvi_raster import get_raster, summarize
+from routes.sse import wants_stream, sse_event, sse_response
 
 satellite_insight_bp = Blueprint('satellite_insight', __name__)
 
 AGRO_API_URL = 'https://api.openweathermap.org/data/3.0/agro/1.0/ndvi'
 
+# Radius (km) of the NDVI window summarized around each point
+NDVI_WINDOW_KM = float(os.getenv('NDVI_WINDOW_KM', '0.5'))
+
+# Batch field health: fields per request, default page size, cells per polygon
+FIELD_HEALTH_MAX_FIELDS = int(os.getenv('FIELD_HEALTH_MAX_FIELDS', '5000'))
+FIELD_HEALTH_PAGE_SIZE = int(os.getenv('FIELD_HEALTH_PAGE_SIZE', '500'))
+NDVI_MAX_POLYGON_CELLS = int(os.getenv('NDVI_MAX_POLYGON_CELLS', '250000'))
+
+# NDVI interpretation bands: (lower bound, status, color, recommendation), highest first
+NDVI_BANDS = [
+    (0.7, 'Healthy', 'green', 'Crops are healthy. Maintain current practices.'),
+    (0.5, 'Moderate', 'yellow', 'Monitor crops for stress. Consider irrigation or nutrients.'),
+    (float('-inf'), 'Unhealthy', 'red', 'Crops may be stressed. Investigate for pests, drought, or disease.'),
+]
+
+def classify_ndvi(ndvi_value):
+    """(status, color, recommendation) for an NDVI value."""
+    for lower, status, color, recommendation in NDVI_BANDS:
+        if ndvi_value > lower:
+            return status, color, recommendation
+    return NDVI_BANDS[-1][1:]
+
+def _stable_hash(text):
+    # Same value in every worker process, unlike the randomized built-in hash()
+    return zlib.crc32(text.encode('utf-8'))
+
+def simulated_ndvi(lat, lon):
+    """Deterministic demo NDVI (0.5-0.9) for points the raster does not cover."""
+    return round(0.5 + 0.4 * (_stable_hash(f'{lat:.4f},{lon:.4f}') % 100) / 100, 2)
+
+def lookup_ndvi(lat, lon):
+    """NDVI for a point: {'ndvi', 'source', 'date', 'window'} from the local raster, else simulated."""
+    raster = get_raster()
+    if raster is not None:
+        value = raster.value(lat, lon)
+        if value is not None:
+            return {
+                'ndvi': round(value, 2),
+                'source': 'raster',
+                'date': raster.date,
+                'window': raster.window_stats(lat, lon, NDVI_WINDOW_KM),
+            }
+    return {'ndvi': simulated_ndvi(lat, lon), 'source': 'simulated', 'date': None, 'window': None}
+
 @satellite_insight_bp.route('/', methods=['POST'])
 def satellite_insight():
     data = request.get_json(silent=True) or {}
@@ -13,11 +62,6 @@ def satellite_insight():
     lon = data.get('lon')
     location = data.get('location')
 
-    # Load API key at request time to avoid import-order issues
-    api_key = os.getenv('OPENWEATHER_API_KEY')
-    if not api_key:
-        return jsonify({'error': 'OpenWeather API key not configured'}), 500
-
     if lat is not None and lon is not None:
         try:
             lat = float(lat)
@@ -33,50 +77,161 @@ def satellite_insight():
         # Helper: deterministic synthetic coordinates within India bounds when geocoding fails
         def synthesize_coords(loc: str):
             # India approx bounds: lat 8-37, lon 68-97
-            h = abs(hash(loc))
+            h = _stable_hash(loc)
             lat_synth = 8 + (h % 2900) / 100.0  # 8.00 - 36.99
             lon_synth = 68 + (h % 2900) / 100.0  # 68.00 - 96.99
             return round(lat_synth, 4), round(lon_synth, 4)
 
-        # Geocode location name
-        geo_url = f'https://api.openweathermap.org/geo/1.0/direct?q={location}&limit=1&appid={api_key}'
-        try:
-            geo_resp = requests.get(geo_url, timeout=10)
-            if geo_resp.ok:
-                geo_json = geo_resp.json()
-                if geo_json:
-                    geo = geo_json[0]
-                    lat, lon = geo.get('lat'), geo.get('lon')
-            # Fallback if missing or invalid
-            if lat is None or lon is None:
-                lat, lon = synthesize_coords(location)
-        except Exception:
-            # Network or service error -> fallback
+        # Gazetteer first, then the persistent geocode cache (which remembers misses too)
+        coords = geocode(location)
+        if coords:
+            lat, lon = coords
+        elif not os.getenv('OPENWEATHER_API_KEY'):
+            return jsonify({'error': 'OpenWeather API key not configured'}), 500
+        else:
             lat, lon = synthesize_coords(location)
     else:
         return jsonify({'error': 'Location or coordinates required'}), 400
 
-    # Simulate NDVI value for demo
-    ndvi_value = round(0.5 + 0.4 * (hash(f'{lat},{lon}') % 100) / 100, 2)  # Simulate NDVI 0.5-0.9
-    # NDVI interpretation
-    if ndvi_value > 0.7:
-        status = 'Healthy'
-        color = 'green'
-        recommendation = 'Crops are healthy. Maintain current practices.'
-    elif ndvi_value > 0.5:
-        status = 'Moderate'
-        color = 'yellow'
-        recommendation = 'Monitor crops for stress. Consider irrigation or nutrients.'
-    else:
-        status = 'Unhealthy'
-        color = 'red'
-        recommendation = 'Crops may be stressed. Investigate for pests, drought, or disease.'
+    ndvi = lookup_ndvi(lat, lon)
+    status, color, recommendation = classify_ndvi(ndvi['ndvi'])
     return jsonify({
         'location': location or f'{lat},{lon}',
         'lat': lat,
         'lon': lon,
-        'ndvi': ndvi_value,
+        'ndvi': ndvi['ndvi'],
         'status': status,
         'color': color,
-        'recommendation': recommendation
-    }) 
\ No newline at end of file
+        'recommendation': recommendation,
+        'source': ndvi['source'],
+        'date': ndvi['date'],
+        'window': ndvi['window'],
+    })
+
+def classify_many(values):
+    """Band index into NDVI_BANDS for each value of an array (NaN -> lowest band)."""
+    values = np.asarray(values, dtype=float)
+    return np.select([values > lower for lower, *_ in NDVI_BANDS[:-1]], range(len(NDVI_BANDS) - 1), len(NDVI_BANDS) - 1)
+
+def _parse_field(index, field):
+    """Normalize one batch entry to {'id', 'lat', 'lon'} or {'id', 'ring'}; raises ValueError."""
+    if not isinstance(field, dict):
+        raise ValueError('field must be an object')
+    field_id = field.get('id', index)
+    geometry = field.get('geometry') or {}
+    ring = field.get('polygon')
+    if ring is None and geometry.get('type') == 'Polygon':
+        ring = (geometry.get('coordinates') or [None])[0]
+    if ring is not None:
+        try:
+            ring = [(float(p[0]), float(p[1])) for p in ring]
+        except (TypeError, ValueError, IndexError):
+            raise ValueError('polygon must be a list of [lon, lat] pairs')
+        # GeoJSON rings repeat the first point at the end
+        if len(ring) > 1 and ring[0] == ring[-1]:
+            ring = ring[:-1]
+        if len(ring) < 3:
+            raise ValueError('polygon needs at least 3 points')
+        return {'id': field_id, 'ring': ring}
+    try:
+        return {'id': field_id, 'lat': float(field['lat']), 'lon': float(field['lon'])}
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('field needs lat/lon or a polygon')
+
+def field_health(fields):
+    """
+    NDVI summary and health band for a page of parsed fields.
+    Points are looked up together in one vectorized read; each polygon is a masked window read.
+    Returns results in input order.
+    """
+    raster = get_raster()
+    results = [None] * len(fields)
+    values = np.full(len(fields), np.nan)
+    points = [i for i, f in enumerate(fields) if 'error' not in f and 'ring' not in f]
+    if points:
+        lats = np.array([fields[i]['lat'] for i in points])
+        lons = np.array([fields[i]['lon'] for i in points])
+        found = raster.values(lats, lons) if raster is not None else np.full(len(points), np.nan)
+        for i, value in zip(points, found):
+            f = fields[i]
+            source = 'raster' if value == value else 'simulated'
+            values[i] = round(float(value), 2) if source == 'raster' else simulated_ndvi(f['lat'], f['lon'])
+            results[i] = {'id': f['id'], 'kind': 'point', 'lat': f['lat'], 'lon': f['lon'], 'ndvi': values[i], 'source': source}
+    for i, f in enumerate(fields):
+        if 'error' in f:
+            results[i] = {'id': f['id'], 'error': f['error']}
+        elif 'ring' in f:
+            ring = np.asarray(f['ring'])
+            lon, lat = (round(float(c), 4) for c in ring.mean(axis=0))
+            stats = None
+            if raster is not None:
+                try:
+                    stats = summarize(raster.polygon_values(f['ring'], NDVI_MAX_POLYGON_CELLS))
+                except ValueError as e:
+                    results[i] = {'id': f['id'], 'error': str(e)}
+                    continue
+            if stats and stats['valid_cells']:
+                values[i] = round(stats['mean'], 2)
+                results[i] = {'id': f['id'], 'kind': 'polygon', 'lat': lat, 'lon': lon, 'ndvi': values[i], 'min': stats['min'], 'max': stats['max'], 'cells': stats['valid_cells'], 'source': 'raster'}
+            else:
+                # Field smaller than a cell (or outside the raster): use the cell under its centroid
+                point = field_health([{'id': f['id'], 'lat': lat, 'lon': lon}])[0]
+                values[i] = point['ndvi']
+                results[i] = dict(point, kind='polygon', cells=0)
+    for i, band in enumerate(classify_many(values)):
+        if 'error' not in results[i]:
+            results[i]['status'] = NDVI_BANDS[band][1]
+            results[i]['color'] = NDVI_BANDS[band][2]
+    return results
+
+@satellite_insight_bp.route('/batch', methods=['POST'])
+def field_health_batch():
+    """
+    Health of many fields: {"fields": [{"id", "lat", "lon"} | {"id", "polygon": [[lon, lat], ...]}],
+    "offset": 0, "limit": 500}. Returns one page with next_offset, or streams `field`
+    events for the whole batch when requested.
+    """
+    data = request.get_json(silent=True) or {}
+    raw = data.get('fields')
+    if not isinstance(raw, list) or not raw:
+        return jsonify({'error': 'fields must be a non-empty list'}), 400
+    if len(raw) > FIELD_HEALTH_MAX_FIELDS:
+        return jsonify({'error': f'at most {FIELD_HEALTH_MAX_FIELDS} fields per request'}), 400
+    fields = []
+    for i, field in enumerate(raw):
+        try:
+            fields.append(_parse_field(i, field))
+        except ValueError as e:
+            fields.append({'id': field.get('id', i) if isinstance(field, dict) else i, 'error': str(e)})
+    bands = {status: {'color': color, 'recommendation': rec} for _, status, color, rec in NDVI_BANDS}
+
+    def summary(results, started):
+        elapsed = time.perf_counter() - started
+        counts = {}
+        for r in results:
+            key = r.get('status', 'error')
+            counts[key] = counts.get(key, 0) + 1
+        return {'fields': len(results), 'counts': counts, 'elapsed_ms': round(elapsed * 1000, 1),
+                'fields_per_second': round(len(results) / elapsed) if elapsed else None, 'bands': bands}
+
+    if wants_stream(request, data):
+        def events():
+            started = time.perf_counter()
+            done = []
+            for start in range(0, len(fields), FIELD_HEALTH_PAGE_SIZE):
+                for result in field_health(fields[start:start + FIELD_HEALTH_PAGE_SIZE]):
+                    done.append({'status': result.get('status', 'error')})
+                    yield sse_event(result, event='field')
+            yield sse_event(summary(done, started), event='done')
+        return sse_response(events(), 'field_health')
+
+    try:
+        offset = max(0, int(data.get('offset', 0)))
+        limit = min(max(1, int(data.get('limit', FIELD_HEALTH_PAGE_SIZE))), FIELD_HEALTH_MAX_FIELDS)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    started = time.perf_counter()
+    results = field_health(fields[offset:offset + limit])
+    next_offset = offset + limit if offset + limit < len(fields) else None
+    print(f"[LOG] /api/satellite-insight/batch fields={len(results)} offset={offset}")
+    return jsonify({'results': results, 'next_offset': next_offset, 'total': len(fields), 'summary': summary(results, started)})
@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+from collections import deque
+
+from flask import Response, stream_with_context
+
+# Timing of recent streamed responses in this worker (time to first event, total duration)
+_streams = deque(maxlen=200)
+_streams_lock = threading.Lock()
+
+
+def wants_stream(request, data=None):
+    """True when the client asked for Server-Sent Events (?stream=1, "stream": true or Accept header)."""
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    if data and data.get('stream') is True:
+        return True
+    return 'text/event-stream' in (request.headers.get('Accept') or '')
+
+
+def sse_event(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    for line in payload.splitlines() or ['']:
+        lines.append(f'data: {line}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_response(events, name):
+    """Wrap a generator of formatted SSE events in a streaming Response and record its timing."""
+    def timed():
+        started = time.perf_counter()
+        first_ms = None
+        count = 0
+        try:
+            for event in events:
+                if first_ms is None:
+                    first_ms = round((time.perf_counter() - started) * 1000, 1)
+                count += 1
+                yield event
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            with _streams_lock:
+                _streams.append({'name': name, 'ttfb_ms': first_ms, 'duration_ms': duration_ms, 'events': count, 'ts': time.time()})
+            print(f"[LOG] SSE {name} ttfb_ms={first_ms} duration_ms={duration_ms} events={count}")
+
+    return Response(
+        stream_with_context(timed()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def stream_answer(chunks):
+    """Forward text chunks as `delta` events, then a final `done` event with the full answer."""
+    started = time.perf_counter()
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield sse_event({'delta': chunk})
+    except Exception as e:
+        print("Streaming error:", str(e))
+        yield sse_event({'error': 'Answer stream interrupted', 'answer': ''.join(parts)}, event='error')
+        return
+    yield sse_event({'answer': ''.join(parts), 'duration_ms': round((time.perf_counter() - started) * 1000, 1)}, event='done')
+
+
+def get_stream_stats():
+    with _streams_lock:
+        streams = list(_streams)
+    return {'streams': len(streams), 'recent': streams[-10:]}
@@ -0,0 +1,23 @@
+from flask import Blueprint, jsonify
+from services.cache_store import all_stats
+from services.singleflight import all_stats as all_flight_stats
+from services.gemini_client import get_call_stats
+from routes.sse import get_stream_stats
+from routes.conditional import get_response_cache_stats
+from services.cache_warmer import last_run as warmer_last_run
+
+stats_bp = Blueprint('stats', __name__)
+
+@stats_bp.route('/', methods=['GET'])
+def stats():
+    """
+    Returns cache hit/miss counters and recent Gemini call and stream latencies for this worker.
+    """
+    return jsonify({
+        'caches': all_stats(),
+        'gemini': get_call_stats(),
+        'streams': get_stream_stats(),
+        'response_cache': get_response_cache_stats(),
+        'single_flight': all_flight_stats(),
+        'cache_warmer': warmer_last_run,
+    })
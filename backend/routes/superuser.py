@@ -1,12 +1,14 @@
 from flask import Blueprint, jsonify
-import sqlite3
 import os
 from datetime import datetime, timezone
 import jwt
 
+from models.db import connect, MARKETPLACE_DB
+from routes.conditional import versioned_json
+
 superuser_bp = Blueprint('superuser', __name__)
 
-MARKET_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'marketplace.db')
+MARKET_DB = MARKETPLACE_DB
 AUTH_JWT_SECRET = os.getenv('JWT_SECRET', 'change-me-in-prod')
 JWT_ALG = 'HS256'
 
@@ -37,16 +39,13 @@ def verify_crop(item_id: int):
     payload, err = require_superuser(request)
     if err:
         return err
-    conn = sqlite3.connect(MARKET_DB)
-    try:
+    with connect(MARKET_DB) as conn:
         now = datetime.now(timezone.utc).isoformat()
         cur = conn.execute('UPDATE listings SET verified_by_superuser = 1, verified_at = ?, verified_by_sub = ? WHERE id = ?', (now, str(payload.get('sub')), item_id))
         conn.commit()
         if cur.rowcount == 0:
             return jsonify({'error': 'Not found'}), 404
         return jsonify({'success': True, 'verified_at': now})
-    finally:
-        conn.close()
 
 
 @superuser_bp.route('/delete-crop/<int:item_id>', methods=['DELETE'])
@@ -55,42 +54,12 @@ def delete_crop(item_id: int):
     payload, err = require_superuser(request)
     if err:
         return err
-    conn = sqlite3.connect(MARKET_DB)
-    try:
+    with connect(MARKET_DB) as conn:
         cur = conn.execute('DELETE FROM listings WHERE id = ?', (item_id,))
         conn.commit()
         if cur.rowcount == 0:
             return jsonify({'error': 'Not found'}), 404
         return jsonify({'success': True})
-    finally:
-        conn.close()
-
-# Equipment verification requests table (minimal) for demo
-# We'll store equipment requests in marketplace.db if not exists
-
-def init_equipment_table():
-    conn = sqlite3.connect(MARKET_DB)
-    try:
-        conn.execute(
-            '''CREATE TABLE IF NOT EXISTS equipment_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                equipment_id TEXT,
-                equipment_name TEXT,
-                brand TEXT,
-                origin TEXT,
-                compliance_info TEXT,
-                created_by_sub TEXT,
-                created_at TEXT,
-                verified_by_superuser INTEGER DEFAULT 0,
-                verified_at TEXT,
-                verified_by_sub TEXT
-            )'''
-        )
-        conn.commit()
-    finally:
-        conn.close()
-
-init_equipment_table()
 
 
 @superuser_bp.route('/verify-equipment/<int:req_id>', methods=['POST'])
@@ -99,16 +68,13 @@ def verify_equipment(req_id: int):
     payload, err = require_superuser(request)
     if err:
         return err
-    conn = sqlite3.connect(MARKET_DB)
-    try:
+    with connect(MARKET_DB) as conn:
         now = datetime.now(timezone.utc).isoformat()
         cur = conn.execute('UPDATE equipment_requests SET verified_by_superuser = 1, verified_at = ?, verified_by_sub = ? WHERE id = ?', (now, str(payload.get('sub')), req_id))
         conn.commit()
         if cur.rowcount == 0:
             return jsonify({'error': 'Not found'}), 404
         return jsonify({'success': True, 'verified_at': now})
-    finally:
-        conn.close()
 
 
 @superuser_bp.route('/delete-equipment/<int:req_id>', methods=['DELETE'])
@@ -117,15 +83,12 @@ def delete_equipment(req_id: int):
     payload, err = require_superuser(request)
     if err:
         return err
-    conn = sqlite3.connect(MARKET_DB)
-    try:
+    with connect(MARKET_DB) as conn:
         cur = conn.execute('DELETE FROM equipment_requests WHERE id = ?', (req_id,))
         conn.commit()
         if cur.rowcount == 0:
             return jsonify({'error': 'Not found'}), 404
         return jsonify({'success': True})
-    finally:
-        conn.close()
 
 
 @superuser_bp.route('/equipment-requests', methods=['GET'])
@@ -134,9 +97,12 @@ def list_equipment_requests():
     payload, err = require_superuser(request)
     if err:
         return err
-    conn = sqlite3.connect(MARKET_DB)
-    try:
-        cur = conn.execute('SELECT id, equipment_id, equipment_name, brand, origin, compliance_info, created_by_sub, created_at, verified_by_superuser, verified_at, verified_by_sub FROM equipment_requests ORDER BY datetime(created_at) DESC')
+    return versioned_json('equipment_requests', _list_equipment_requests)
+
+
+def _list_equipment_requests():
+    with connect(MARKET_DB) as conn:
+        cur = conn.execute('SELECT id, equipment_id, equipment_name, brand, origin, compliance_info, created_by_sub, created_at, verified_by_superuser, verified_at, verified_by_sub FROM equipment_requests ORDER BY created_at DESC, id DESC')
         rows = cur.fetchall()
         items = []
         for r in rows:
@@ -153,6 +119,4 @@ def list_equipment_requests():
                 'verified_at': r[9],
                 'verified_by_sub': r[10],
             })
-        return jsonify(items)
-    finally:
-        conn.close()
\ No newline at end of file
+        return jsonify(items)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request
-from services.gemini_service import ask_gemini
+from services.gemini_service import ask_gemini, ask_gemini_stream
+from routes.sse import wants_stream, sse_response, stream_answer
 
 tips_bp = Blueprint('tips', __name__)
 
@@ -31,5 +32,8 @@ def ai_tip():
         f"Answer this farming question in 2-4 short, clear bullet points. No intro or outro, just the tips.\n"
         f"Question: {question}"
     )
+    # Stream tokens as Server-Sent Events when requested; JSON otherwise
+    if wants_stream(request, data):
+        return sse_response(stream_answer(ask_gemini_stream(gemini_prompt, language=language)), '/api/tips/ai')
     answer = ask_gemini(gemini_prompt, language=language)
     return jsonify({'answer': answer})
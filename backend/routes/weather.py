@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from services.weather_service import get_weather_forecast
+from services.weather_service import get_weather_forecast, get_full_forecast, get_full_forecasts, WEATHER_BATCH_MAX_LOCATIONS
 
 weather_bp = Blueprint('weather', __name__)
 
@@ -7,12 +7,31 @@ weather_bp = Blueprint('weather', __name__)
 def weather():
     """
     Receives location; returns 5-day weather forecast from OpenWeatherMap.
+    With "mode": "full", returns all 3-hour slots as columns plus daily agronomic rollups.
     """
     data = request.get_json(silent=True) or {}
     location = data.get('location')
     if not location:
         return jsonify({'error': 'location is required'}), 400
     print("[LOG] /api/weather/ called with:", data)
+    if data.get('mode') == 'full':
+        forecast = get_full_forecast(location)
+        return jsonify(forecast), 502 if 'error' in forecast else 200
     forecast = get_weather_forecast(location)
     print("[LOG] Weather forecast:", forecast)
     return jsonify(forecast)
+
+@weather_bp.route('/batch', methods=['POST'])
+def weather_batch():
+    """
+    Full forecasts with daily rollups for many locations: {"locations": [...]}.
+    Results come back in request order; failed locations carry an "error".
+    """
+    data = request.get_json(silent=True) or {}
+    locations = [str(l).strip() for l in data.get('locations') or [] if str(l or '').strip()] if isinstance(data.get('locations'), list) else []
+    if not locations:
+        return jsonify({'error': 'locations must be a non-empty list'}), 400
+    if len(locations) > WEATHER_BATCH_MAX_LOCATIONS:
+        return jsonify({'error': f'at most {WEATHER_BATCH_MAX_LOCATIONS} locations per request'}), 400
+    print(f"[LOG] /api/weather/batch called with {len(locations)} locations")
+    return jsonify({'results': get_full_forecasts(locations)})
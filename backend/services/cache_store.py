@@ -0,0 +1,330 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Local SQLite cache shared by all gunicorn workers on the host (WAL mode).
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache.db'))
+# Full size accounting (and the expired sweep) runs every N writes per namespace and worker,
+# or sooner when the running estimate crosses a bound; other writes are O(1)
+CACHE_EVICT_EVERY = int(os.getenv('CACHE_EVICT_EVERY', '100'))
+CACHE_EVICT_LOW_WATER = 0.9
+
+_local = threading.local()
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+# All caches created in this process, by namespace (for the stats endpoint)
+_registry = {}
+
+
+def _connect(db_path):
+    # Per thread, and reopened after fork: SQLite handles must not be shared across processes
+    conns = getattr(_local, 'conns', None)
+    if conns is None or getattr(_local, 'pid', None) != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conns[db_path] = conn
+    if db_path not in _schema_ready:
+        with _schema_lock:
+            if db_path not in _schema_ready:
+                conn.execute(
+                    '''CREATE TABLE IF NOT EXISTS cache_entries (
+                        namespace TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        stored_at REAL NOT NULL,
+                        expires_at REAL NOT NULL,
+                        last_access REAL NOT NULL,
+                        PRIMARY KEY (namespace, key)
+                    ) WITHOUT ROWID'''
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_lru ON cache_entries (namespace, last_access)')
+                # Cross-worker lock table for single-flight upstream fetches
+                conn.execute(
+                    '''CREATE TABLE IF NOT EXISTS inflight_leases (
+                        name TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        owner TEXT NOT NULL,
+                        expires_at REAL NOT NULL,
+                        PRIMARY KEY (name, key)
+                    ) WITHOUT ROWID'''
+                )
+                _schema_ready.add(db_path)
+    return conn
+
+
+def make_key(*parts):
+    """Build a stable cache key from simple values (str/int/None)."""
+    if len(parts) == 1 and isinstance(parts[0], str):
+        return parts[0]
+    return json.dumps(list(parts), ensure_ascii=False, separators=(',', ':'))
+
+
+def _norm_key(key):
+    return key if isinstance(key, str) else make_key(*key)
+
+
+class CacheEntry:
+    __slots__ = ('value', 'stored_at', 'expires_at')
+
+    def __init__(self, value, stored_at, expires_at):
+        self.value = value
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires_at
+
+
+class CacheStore:
+    """Bounded LRU + TTL cache persisted in SQLite, one namespace per use.
+
+    Values must be JSON-serializable. Entries past their TTL are kept for
+    ``stale_seconds`` so callers can serve stale data (``get_entry(..., allow_stale=True)``);
+    anything older, and least-recently-used entries beyond ``max_entries`` or
+    ``max_bytes``, are evicted every ``CACHE_EVICT_EVERY`` writes, or as soon as this
+    worker's running (entries, bytes) estimate crosses a bound.
+    """
+
+    def __init__(self, namespace, ttl_seconds, max_entries=1000, max_bytes=16 * 1024 * 1024, stale_seconds=0, db_path=None):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self.db_path = db_path or CACHE_DB_PATH
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'errors': 0}
+        # (entries, bytes) as of the last eviction plus writes since; replacements overcount
+        self._estimate = None
+        self._writes = 0
+        _registry[namespace] = self
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _conn(self):
+        return _connect(self.db_path)
+
+    def get_entry(self, key, allow_stale=False, count=True):
+        """Return a CacheEntry or None. Expired entries are only returned with allow_stale.
+
+        Pass count=False for internal re-checks so they do not skew the hit/miss counters.
+        """
+        key = _norm_key(key)
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                'SELECT value, stored_at, expires_at FROM cache_entries WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            ).fetchone()
+            if row is None or (row[2] <= now and not allow_stale):
+                if count:
+                    self._count('misses')
+                return None
+            conn.execute(
+                'UPDATE cache_entries SET last_access = ? WHERE namespace = ? AND key = ?',
+                (now, self.namespace, key)
+            )
+        except sqlite3.Error as e:
+            print(f"Cache error ({self.namespace}): {e}")
+            self._count('errors')
+            return None
+        entry = CacheEntry(json.loads(row[0]), row[1], row[2])
+        if count:
+            self._count('stale_hits' if entry.expired else 'hits')
+        return entry
+
+    def get(self, key, count=True):
+        entry = self.get_entry(key, count=count)
+        return entry.value if entry else None
+
+    def set(self, key, value, ttl_seconds=None):
+        key = _norm_key(key)
+        payload = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        try:
+            conn = self._conn()
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, size, stored_at, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.namespace, key, payload, len(payload.encode('utf-8')), now, now + ttl, now)
+            )
+            self._count('sets')
+            self._after_write(conn, now, 1, len(payload.encode('utf-8')))
+        except sqlite3.Error as e:
+            print(f"Cache error ({self.namespace}): {e}")
+            self._count('errors')
+
+    def set_many(self, items, ttl_seconds=None):
+        """Store (key, value) pairs in one transaction, evicting once at the end."""
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        rows = []
+        for key, value in items:
+            payload = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+            rows.append((self.namespace, _norm_key(key), payload, len(payload.encode('utf-8')), now, now + ttl, now))
+        if not rows:
+            return
+        conn = self._conn()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, size, stored_at, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        self._count('sets', len(rows))
+        self._after_write(conn, now, len(rows), sum(row[3] for row in rows))
+
+    def delete(self, key):
+        key = _norm_key(key)
+        self._conn().execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (self.namespace, key))
+
+    def clear(self):
+        self._conn().execute('DELETE FROM cache_entries WHERE namespace = ?', (self.namespace,))
+
+    def _after_write(self, conn, now, entries, size):
+        with self._lock:
+            self._writes += entries
+            if self._estimate is not None:
+                self._estimate = (self._estimate[0] + entries, self._estimate[1] + size)
+            due = (self._estimate is None or self._writes >= CACHE_EVICT_EVERY
+                   or self._estimate[0] > self.max_entries or self._estimate[1] > self.max_bytes)
+            if due:
+                self._writes = 0
+        if due:
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        cur = conn.execute(
+            'DELETE FROM cache_entries WHERE namespace = ? AND expires_at < ?',
+            (self.namespace, now - self.stale_seconds)
+        )
+        evicted = max(cur.rowcount, 0)
+        count, total = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?',
+            (self.namespace,)
+        ).fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            # Evict down to the low-water mark so a full cache does not recount on every write
+            target_entries = int(self.max_entries * CACHE_EVICT_LOW_WATER)
+            target_bytes = int(self.max_bytes * CACHE_EVICT_LOW_WATER)
+            excess_entries = count - target_entries
+            excess_bytes = total - target_bytes
+            victims = []
+            for key, size in conn.execute(
+                'SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY last_access',
+                (self.namespace,)
+            ):
+                if excess_entries <= 0 and excess_bytes <= 0:
+                    break
+                victims.append((self.namespace, key))
+                excess_entries -= 1
+                excess_bytes -= size
+            conn.executemany('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', victims)
+            evicted += len(victims)
+            count, total = target_entries + excess_entries, target_bytes + excess_bytes
+        with self._lock:
+            self._estimate = (count, total)
+        if evicted:
+            self._count('evictions', evicted)
+
+    def keys(self, include_expired=False):
+        """Yield stored keys, most recently used first."""
+        sql = 'SELECT key FROM cache_entries WHERE namespace = ?'
+        params = [self.namespace]
+        if not include_expired:
+            sql += ' AND expires_at > ?'
+            params.append(time.time())
+        for (key,) in self._conn().execute(sql + ' ORDER BY last_access DESC', params).fetchall():
+            yield key
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['stale_hits']) / lookups, 3) if lookups else None
+        try:
+            count, total, expired = self._conn().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(expires_at <= ?), 0) FROM cache_entries WHERE namespace = ?',
+                (time.time(), self.namespace)
+            ).fetchone()
+            stats.update({'entries': count, 'bytes': total, 'expired_entries': expired})
+        except sqlite3.Error:
+            pass
+        stats.update({
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl_seconds,
+            'pid': os.getpid(),
+        })
+        return stats
+
+
+def acquire_lease(name, key, ttl_seconds, db_path=None):
+    """Try to take the shared lease for (name, key). Returns an owner token, or None if another holder has it."""
+    conn = _connect(db_path or CACHE_DB_PATH)
+    now = time.time()
+    owner = f"{os.getpid()}:{threading.get_ident()}:{now}"
+    try:
+        conn.execute('DELETE FROM inflight_leases WHERE name = ? AND key = ? AND expires_at < ?', (name, key, now))
+        cur = conn.execute(
+            'INSERT OR IGNORE INTO inflight_leases (name, key, owner, expires_at) VALUES (?, ?, ?, ?)',
+            (name, key, owner, now + ttl_seconds)
+        )
+    except sqlite3.Error as e:
+        print(f"Lease error ({name}): {e}")
+        return None
+    return owner if cur.rowcount == 1 else None
+
+
+def lease_held(name, key, db_path=None):
+    try:
+        row = _connect(db_path or CACHE_DB_PATH).execute(
+            'SELECT 1 FROM inflight_leases WHERE name = ? AND key = ? AND expires_at >= ?',
+            (name, key, time.time())
+        ).fetchone()
+    except sqlite3.Error:
+        return False
+    return row is not None
+
+
+def renew_lease(name, key, owner, ttl_seconds, db_path=None):
+    """Extend a lease we hold to ttl_seconds from now. False if it lapsed and another holder took it."""
+    try:
+        cur = _connect(db_path or CACHE_DB_PATH).execute(
+            'UPDATE inflight_leases SET expires_at = ? WHERE name = ? AND key = ? AND owner = ?',
+            (time.time() + ttl_seconds, name, key, owner)
+        )
+    except sqlite3.Error as e:
+        print(f"Lease error ({name}): {e}")
+        return False
+    return cur.rowcount == 1
+
+
+def release_lease(name, key, owner, db_path=None):
+    try:
+        _connect(db_path or CACHE_DB_PATH).execute(
+            'DELETE FROM inflight_leases WHERE name = ? AND key = ? AND owner = ?', (name, key, owner)
+        )
+    except sqlite3.Error as e:
+        print(f"Lease error ({name}): {e}")
+
+
+def all_stats():
+    return {name: cache.stats() for name, cache in _registry.items()}
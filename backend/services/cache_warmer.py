@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from services.cache_store import acquire_lease, renew_lease, release_lease
+from services.gazetteer import canonical_location
+from services.crop_prices_service import crop_price_cache, insights_cache, get_popular_crops, get_market_insights, warm_prices, price_cache_key, insights_cache_key
+
+# Scheduled pre-fetch of prices and market insights for popular crops x top locations.
+# Disabled unless WARMER_INTERVAL_MINUTES > 0.
+WARMER_INTERVAL_MINUTES = float(os.getenv('WARMER_INTERVAL_MINUTES', '0'))
+WARMER_TOP_LOCATIONS = int(os.getenv('WARMER_TOP_LOCATIONS', '10'))
+# Budget per run: parallel fetches, cells fetched, and minimum gap between fetch starts
+WARMER_CONCURRENCY = int(os.getenv('WARMER_CONCURRENCY', '2'))
+WARMER_MAX_FETCHES = int(os.getenv('WARMER_MAX_FETCHES', '60'))
+WARMER_MIN_GAP_SECONDS = float(os.getenv('WARMER_MIN_GAP_SECONDS', '1'))
+# Locations that are always warmed, comma separated (in addition to learned ones)
+WARMER_LOCATIONS = [l.strip() for l in os.getenv('WARMER_LOCATIONS', '').split(',') if l.strip()]
+
+_started = False
+_start_lock = threading.Lock()
+last_run = {}
+
+
+def top_locations(limit=WARMER_TOP_LOCATIONS):
+    """
+    Most requested locations, learned from the shared price cache: locations ranked by how
+    many crops have been looked up for them (stale entries included), then by recency.
+    """
+    counts = Counter()
+    order = {}
+    for key in crop_price_cache.keys(include_expired=True):
+        try:
+            location, _crop = json.loads(key)
+        except (ValueError, TypeError):
+            continue
+        counts[location] += 1
+        order.setdefault(location, len(order))
+    ranked = sorted(counts, key=lambda loc: (-counts[loc], order[loc]))
+    locations = []
+    for location in [canonical_location(l) for l in WARMER_LOCATIONS] + ranked:
+        if location not in locations:
+            locations.append(location)
+    return locations[:max(limit, len(WARMER_LOCATIONS))]
+
+
+def _warm_insights(location, crop_name):
+    get_market_insights(crop_name, location)
+    return True
+
+
+def _expiring(cache, key, interval_seconds):
+    entry = cache.get_entry(key, count=False)
+    return entry is None or entry.expires_at - time.time() <= interval_seconds
+
+
+def warm_once(interval_seconds=None, keep_lease=None):
+    """
+    Run one warming pass. Prices and market insights that would expire before the next
+    run are refreshed; each fetch counts against WARMER_MAX_FETCHES and the start gap.
+    keep_lease(), if given, renews the run lease before each fetch and while fetches
+    finish; the pass stops submitting once it returns False. Returns a summary dict.
+    """
+    interval_seconds = interval_seconds if interval_seconds is not None else WARMER_INTERVAL_MINUTES * 60
+    started = time.monotonic()
+    locations = top_locations()
+    cells = [(location, crop) for location in locations for crop in get_popular_crops()]
+    summary = {'locations': len(locations), 'cells': len(cells), 'fetched': 0, 'skipped': 0, 'errors': 0, 'submitted': 0}
+    futures = []
+    with ThreadPoolExecutor(max_workers=WARMER_CONCURRENCY, thread_name_prefix='cache-warmer') as pool:
+        last_start = 0.0
+        stopped = False
+        for location, crop_name in cells:
+            fetches = []
+            if _expiring(crop_price_cache, price_cache_key(location, crop_name), interval_seconds):
+                fetches.append((warm_prices, (location, crop_name, interval_seconds)))
+            if _expiring(insights_cache, insights_cache_key(crop_name, location), interval_seconds):
+                fetches.append((_warm_insights, (location, crop_name)))
+            if not fetches:
+                summary['skipped'] += 1
+                continue
+            for fn, args in fetches:
+                if summary['submitted'] >= WARMER_MAX_FETCHES:
+                    stopped = True
+                    break
+                if keep_lease is not None and not keep_lease():
+                    print("[LOG] Cache warmer lost its run lease; stopping this pass")
+                    stopped = True
+                    break
+                # Rate budget: space out fetch starts
+                gap = WARMER_MIN_GAP_SECONDS - (time.monotonic() - last_start)
+                if gap > 0:
+                    time.sleep(gap)
+                last_start = time.monotonic()
+                futures.append(pool.submit(fn, *args))
+                summary['submitted'] += 1
+            if stopped:
+                break
+        # Renew well inside the lease while slow fetches finish
+        while wait(futures, timeout=max(1.0, interval_seconds * 0.3)).not_done:
+            if keep_lease is not None:
+                keep_lease()
+    for future in futures:
+        try:
+            if future.result():
+                summary['fetched'] += 1
+        except Exception as e:
+            print(f"Cache warmer error: {str(e)}")
+            summary['errors'] += 1
+    summary['duration_s'] = round(time.monotonic() - started, 2)
+    summary['finished_at'] = time.time()
+    last_run.clear()
+    last_run.update(summary)
+    print(f"[LOG] Cache warmer run: {summary}")
+    return summary
+
+
+def _loop(interval_seconds):
+    while True:
+        # One run per interval across all workers: whoever takes the lease warms. It is
+        # renewed while the pass runs, so a slow pass never overlaps another worker's
+        lease_seconds = interval_seconds
+        started = time.monotonic()
+        owner = acquire_lease('cache_warmer', 'run', lease_seconds)
+        if owner:
+            try:
+                warm_once(interval_seconds, lambda: renew_lease('cache_warmer', 'run', owner, lease_seconds))
+            except Exception as e:
+                print(f"Cache warmer run failed: {str(e)}")
+            finally:
+                # Hold the lease to the end of this interval's slot, or release it if the pass overran
+                remaining = lease_seconds - (time.monotonic() - started)
+                if remaining <= 0 or not renew_lease('cache_warmer', 'run', owner, remaining):
+                    release_lease('cache_warmer', 'run', owner)
+        time.sleep(interval_seconds)
+
+
+def start_cache_warmer():
+    """Start the background warmer thread in this process (no-op if disabled or already started)."""
+    global _started
+    if WARMER_INTERVAL_MINUTES <= 0:
+        return False
+    with _start_lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(target=_loop, args=(WARMER_INTERVAL_MINUTES * 60,), name='cache-warmer', daemon=True).start()
+    return True
+
+
+if __name__ == '__main__':
+    # One-off run, e.g. from cron: python -m services.cache_warmer
+    from dotenv import load_dotenv
+    load_dotenv()
+    warm_once()
@@ -1,52 +1,241 @@
 import os
-import requests
 import re
+import time
 from datetime import datetime, timedelta
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from threading import Lock
+from services.gemini_client import generate_content, response_text
 from services.gemini_service import ask_gemini
+from services.singleflight import SingleFlight
+from services.cache_store import CacheStore
+from services.price_history import record_prices, attach_history, recent_history
+from services.gazetteer import canonical_location, display_location
+from services.geocoder import market_location
+from services.crop_taxonomy import canonical_crop, lineage, resolve as resolve_crop
 
-# In-memory cache: (location, crop_name) -> { 'data': ..., 'timestamp': ... }
-crop_price_cache = {}
-CACHE_EXPIRY_HOURS = 3
+# Shared cache (SQLite, all workers): (location, crop_name) -> price payload
+CACHE_EXPIRY_HOURS = float(os.getenv('CACHE_EXPIRY_HOURS', '3'))
+# Expired prices are kept this long so they can be served while a refresh runs
+STALE_PRICE_HOURS = float(os.getenv('STALE_PRICE_HOURS', '168'))
+crop_price_cache = CacheStore(
+    'crop_prices',
+    ttl_seconds=int(CACHE_EXPIRY_HOURS * 3600),
+    max_entries=int(os.getenv('CROP_PRICE_CACHE_MAX_ENTRIES', '5000')),
+    max_bytes=int(os.getenv('CROP_PRICE_CACHE_MAX_MB', '16')) * 1024 * 1024,
+    stale_seconds=int(STALE_PRICE_HOURS * 3600),
+)
 
-# For background Gemini fetches
+# For background Gemini fetches: key -> time the refresh was queued (this worker)
 pending_gemini_fetches = {}
+_pending_lock = Lock()
+refresh_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PRICE_REFRESH_WORKERS', '2')),
+    thread_name_prefix='price-refresh'
+)
+
+# Market insights change more slowly than prices but faster than generic answers
+insights_cache = CacheStore(
+    'market_insights',
+    ttl_seconds=int(float(os.getenv('MARKET_INSIGHTS_TTL_HOURS', '6')) * 3600),
+    max_entries=int(os.getenv('MARKET_INSIGHTS_CACHE_MAX_ENTRIES', '5000')),
+)
+INSIGHTS_UNAVAILABLE = "Market data analysis temporarily unavailable. Consider selling during peak demand seasons."
+
+# Runs the independent price and insights branches of a request concurrently
+fanout_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PRICE_FANOUT_WORKERS', '8')),
+    thread_name_prefix='price-fanout'
+)
+
+# Bounded pool for the misses of bulk price matrix requests
+bulk_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('BULK_PRICE_WORKERS', '4')),
+    thread_name_prefix='price-bulk'
+)
+
+# Concurrent cache misses for one (location, crop), in any worker, wait on a single upstream fetch
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv('SINGLEFLIGHT_WAIT_SECONDS', '40'))
+price_flight = SingleFlight('crop_prices', shared=True)
+insights_flight = SingleFlight('market_insights')
+
+def price_cache_key(location, crop_name):
+    # Aliases ("Bangalore", "bengaluru, karnataka") share one key via the gazetteer;
+    # unknown villages share the key of the nearest known district once geocoded.
+    # Cache-only: geocoding happens in the pooled fetch, never before a cache lookup
+    return (canonical_location(market_location(location, cached_only=True)), canonical_crop(crop_name))
+
+def insights_cache_key(crop_name, location):
+    # Same cache-only location resolution as price_cache_key
+    return (canonical_crop(crop_name), canonical_location(market_location(location, cached_only=True)))
+
+def _fetch_and_store(location, crop_name, key, min_ttl_seconds=0):
+    # Another caller may have filled the cache while we waited to lead
+    entry = crop_price_cache.get_entry(key, count=False)
+    if entry is not None and entry.expires_at - time.time() > min_ttl_seconds:
+        return entry.value
+    # Geocode off the request path; a village that snaps to a district shares its entry
+    location = market_location(location)
+    market_key = price_cache_key(location, crop_name)
+    entry = crop_price_cache.get_entry(market_key, count=False) if market_key != key else None
+    if entry is not None and entry.expires_at - time.time() > min_ttl_seconds:
+        data = entry.value
+    else:
+        data = _fetch_gemini_prices(display_location(location), crop_name)
+        try:
+            # Keep every real observation; charts read stored history instead of synthetic points
+            record_prices(data, location, crop_name)
+            attach_history(data, location, crop_name)
+        except Exception as e:
+            print(f"Error recording price history: {str(e)}")
+        if market_key != key:
+            crop_price_cache.set(market_key, data)
+    crop_price_cache.set(key, data)
+    return data
 
 def get_real_crop_prices(location, crop_name):
     """
     Fetch real-time crop prices using Gemini API to scrape government websites.
     Use cache for repeated queries. If not cached, fetch real data directly (no fallback).
+    Concurrent misses for the same key share a single Gemini fetch.
     """
-    key = (location.lower().strip(), crop_name.lower().strip())
-    now = datetime.now()
+    key = price_cache_key(location, crop_name)
     # Check cache
-    if key in crop_price_cache:
-        cached = crop_price_cache[key]
-        if now - cached['timestamp'] < timedelta(hours=CACHE_EXPIRY_HOURS):
-            return cached['data']
-    
+    data = crop_price_cache.get(key)
+    if data is not None:
+        return data
+
     # Fetch real data directly (no fallback)
-    data = _fetch_gemini_prices(location, crop_name)
-    # Cache the result
-    crop_price_cache[key] = {
-        'data': data,
-        'timestamp': datetime.now()
-    }
+    return price_flight.do(
+        key,
+        lambda: _fetch_and_store(location, crop_name, key),
+        timeout=SINGLEFLIGHT_WAIT_SECONDS,
+        recheck=lambda: crop_price_cache.get(key, count=False),
+    )
+
+def warm_prices(location, crop_name, min_ttl_seconds=0):
+    """
+    Make sure (location, crop) is cached for at least min_ttl_seconds more, fetching if not.
+    Returns True if Gemini was called. Used by the scheduled cache warmer.
+    """
+    key = price_cache_key(location, crop_name)
+    entry = crop_price_cache.get_entry(key, count=False)
+    if entry is not None and entry.expires_at - time.time() > min_ttl_seconds:
+        return False
+    price_flight.do(
+        key,
+        lambda: _fetch_and_store(location, crop_name, key, min_ttl_seconds),
+        timeout=SINGLEFLIGHT_WAIT_SECONDS,
+    )
+    return True
+
+def get_crop_prices_swr(location, crop_name, allow_fallback=True):
+    """
+    Stale-while-revalidate lookup. Returns (prices_data, state) without waiting on Gemini
+    whenever the key has been seen before:
+    - 'fresh': cached data within CACHE_EXPIRY_HOURS
+    - 'stale': expired cached data, flagged pending while a background refresh runs
+    - 'fallback': estimated prices, flagged pending (only if allow_fallback)
+    With allow_fallback=False an unseen key is fetched synchronously ('fresh').
+    """
+    key = price_cache_key(location, crop_name)
+    entry = crop_price_cache.get_entry(key, allow_stale=True)
+    if entry is not None and not entry.expired:
+        return entry.value, 'fresh'
+    if entry is None and not allow_fallback:
+        return get_real_crop_prices(location, crop_name), 'fresh'
+    schedule_refresh(location, crop_name, key)
+    if entry is None:
+        return get_fallback_prices(location, crop_name, pending=True, key=key), 'fallback'
+    return _stale_prices(entry), 'stale'
+
+def _stale_prices(entry):
+    data = entry.value
+    if isinstance(data, dict) and isinstance(data.get('data'), dict):
+        data['data']['pending'] = True
+        data['data']['stale'] = True
+        data['data']['cached_at'] = datetime.fromtimestamp(entry.stored_at).isoformat()
     return data
 
+def iter_price_matrix(crops, locations, deadline_seconds):
+    """
+    Yield (crop_name, location, status, prices_data) for every crop x location cell,
+    cache hits first and fetched cells as they complete. Status is one of:
+    - 'fresh': cached within CACHE_EXPIRY_HOURS or fetched now
+    - 'stale': expired cached data (refreshed in the background)
+    - 'fallback': estimated prices because the fetch missed the global deadline
+    - 'error': the fetch failed; estimated prices are returned
+    Misses are fetched concurrently on the bounded bulk pool. Keys come from the gazetteer
+    and caches only (geocoding runs inside the pooled fetch), and every cell counts
+    against deadline_seconds: misses reached after it are answered with fallback prices.
+    """
+    deadline = time.monotonic() + deadline_seconds
+    futures = {}
+    for crop_name in crops:
+        for location in locations:
+            key = price_cache_key(location, crop_name)
+            entry = crop_price_cache.get_entry(key, allow_stale=True)
+            if entry is not None and not entry.expired:
+                yield crop_name, location, 'fresh', entry.value
+            elif entry is not None:
+                schedule_refresh(location, crop_name, key)
+                yield crop_name, location, 'stale', _stale_prices(entry)
+            elif time.monotonic() >= deadline:
+                schedule_refresh(location, crop_name, key)
+                yield crop_name, location, 'fallback', get_fallback_prices(location, crop_name, pending=True, key=key)
+            else:
+                futures[bulk_pool.submit(get_real_crop_prices, location, crop_name)] = (crop_name, location, key)
+
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+            pending.discard(future)
+            crop_name, location, key = futures[future]
+            try:
+                yield crop_name, location, 'fresh', future.result()
+            except Exception as e:
+                data = get_fallback_prices(location, crop_name, key=key)
+                data['error'] = str(e)
+                yield crop_name, location, 'error', data
+    except FuturesTimeout:
+        # Unfinished fetches keep running and fill the cache for the next request
+        for future in pending:
+            crop_name, location, key = futures[future]
+            yield crop_name, location, 'fallback', get_fallback_prices(location, crop_name, pending=True, key=key)
+
+
+def schedule_refresh(location, crop_name, key):
+    """Queue a background refresh for key unless one is already pending in this worker."""
+    with _pending_lock:
+        if key in pending_gemini_fetches:
+            return False
+        pending_gemini_fetches[key] = datetime.now()
+    try:
+        refresh_pool.submit(fetch_and_cache_gemini, location, crop_name, key)
+    except RuntimeError:
+        # Pool shut down (interpreter exit)
+        with _pending_lock:
+            pending_gemini_fetches.pop(key, None)
+        return False
+    return True
+
 def fetch_and_cache_gemini(location, crop_name, key):
     """Fetch from Gemini and update cache."""
-    data = _fetch_gemini_prices(location, crop_name)
-    crop_price_cache[key] = {
-        'data': data,
-        'timestamp': datetime.now()
-    }
-    # Remove from pending
-    if key in pending_gemini_fetches:
-        del pending_gemini_fetches[key]
+    try:
+        # Through the single-flight group so foreground misses and other workers share it
+        price_flight.do(
+            key,
+            lambda: _fetch_and_store(location, crop_name, key),
+            timeout=SINGLEFLIGHT_WAIT_SECONDS,
+            recheck=lambda: crop_price_cache.get(key, count=False),
+        )
+    except Exception as e:
+        print(f"Background price refresh failed for {key}: {str(e)}")
+    finally:
+        # Remove from pending
+        with _pending_lock:
+            pending_gemini_fetches.pop(key, None)
 
 def _fetch_gemini_prices(location, crop_name):
-    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     prompt = f"""
     You are an expert agricultural data analyst. I need current mandi prices for {crop_name} in {location}, India.
     Please search for and provide the most recent mandi prices from reliable government sources like:
@@ -88,16 +277,10 @@ def _fetch_gemini_prices(location, crop_name):
     Only return valid JSON, no additional text or explanations.
     """
     try:
-        # Use the same configurable model as the gemini_service
-        GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
-        response = requests.post(
-            f"https://generativelanguage.googleapis.com/v1/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}",
-            json={
-                "contents": [{"parts": [{"text": prompt}]}]
-            }
-        )
+        # Shared pooled client (same configurable model as the gemini_service)
+        response = generate_content(prompt)
         if response.ok:
-            gemini_response = response.json()['candidates'][0]['content']['parts'][0]['text']
+            gemini_response = response_text(response)
             try:
                 json_match = re.search(r'\{.*\}', gemini_response, re.DOTALL)
                 if json_match:
@@ -175,9 +358,10 @@ def create_structured_data_from_text(text, location, crop_name):
         print(f"Error parsing text response: {str(e)}")
         raise e
 
-def get_fallback_prices(location, crop_name, pending=False):
+def get_fallback_prices(location, crop_name, pending=False, key=None):
     """
     Provide fallback prices based on crop type and location. If pending=True, add a flag to indicate real data is being fetched.
+    Pass the already resolved price_cache_key as key; only local SQLite is read, never the network.
     """
     # Realistic price ranges based on current market conditions
     price_ranges = {
@@ -195,18 +379,21 @@ def get_fallback_prices(location, crop_name, pending=False):
         'spices': {'base': 5500, 'min': 5400, 'max': 5600}
     }
     
-    crop_lower = crop_name.lower()
+    # Nearest priced ancestor in the crop taxonomy ("tur" -> "pulses")
+    crop = resolve_crop(crop_name)
     price_data = None
-    
-    for crop_key, prices in price_ranges.items():
-        if crop_key in crop_lower or crop_lower in crop_key:
-            price_data = prices
+    for crop_key in lineage(crop.id) if crop else []:
+        price_data = price_ranges.get(crop_key)
+        if price_data:
             break
     
     if not price_data:
         price_data = {'base': 2000, 'min': 1950, 'max': 2050}
     
     current_date = datetime.now().strftime("%Y-%m-%d")
+    # Prefer stored observations for this crop/location over a synthetic trend
+    history_location = key[0] if key else canonical_location(market_location(location, cached_only=True))
+    stored_history = recent_history(crop_name, history_location)
     
     result = {
         "success": True,
@@ -222,7 +409,7 @@ def get_fallback_prices(location, crop_name, pending=False):
                     "quality": "Grade A",
                     "last_updated": current_date,
                     "source": "Estimated Market Rate",
-                    "history": [
+                    "history": stored_history if len(stored_history) >= 2 else [
                         {"date": (datetime.now() - timedelta(days=20)).strftime("%Y-%m-%d"), "price_per_quintal": int(price_data['base'] * 0.95)},
                         {"date": (datetime.now() - timedelta(days=15)).strftime("%Y-%m-%d"), "price_per_quintal": int(price_data['base'] * 0.98)},
                         {"date": (datetime.now() - timedelta(days=10)).strftime("%Y-%m-%d"), "price_per_quintal": int(price_data['base'] * 1.00)},
@@ -241,10 +428,23 @@ def get_fallback_prices(location, crop_name, pending=False):
 
 def get_market_insights(crop_name, location):
     """
-    Get market insights and trends using Gemini API
+    Get market insights and trends using Gemini API, cached per (crop, location)
+    for MARKET_INSIGHTS_TTL_HOURS.
     """
+    # No network geocoding here: villages snap to a district once the price fetch has geocoded them
+    key = insights_cache_key(crop_name, location)
+    location = market_location(location, cached_only=True)
+    cached = insights_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        return insights_flight.do(key, lambda: _fetch_market_insights(crop_name, location, key), timeout=SINGLEFLIGHT_WAIT_SECONDS)
+    except Exception:
+        return INSIGHTS_UNAVAILABLE
+
+def _fetch_market_insights(crop_name, location, key):
     prompt = f"""
-    Provide brief market insights for {crop_name} in {location}, India. Include:
+    Provide brief market insights for {crop_name} in {display_location(location)}, India. Include:
     1. Current price trend (rising/falling/stable)
     2. Best time to sell
     3. Market demand outlook
@@ -254,10 +454,14 @@ def get_market_insights(crop_name, location):
     """
     
     try:
-        insights = ask_gemini(prompt)
-        return insights
+        # Own cache with a shorter TTL than the general Gemini answer cache
+        insights = ask_gemini(prompt, cache=False)
     except:
-        return "Market data analysis temporarily unavailable. Consider selling during peak demand seasons."
+        return INSIGHTS_UNAVAILABLE
+    if insights.startswith('Gemini API error'):
+        return INSIGHTS_UNAVAILABLE
+    insights_cache.set(key, insights)
+    return insights
 
 def get_popular_crops():
     """
@@ -0,0 +1,138 @@
+import csv
+import os
+import re
+import threading
+from functools import lru_cache
+
+# Canonical crop ids, parent categories and English/Hindi/Kannada aliases
+CROP_TAXONOMY_PATH = os.getenv('CROP_TAXONOMY_PATH', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'crop_taxonomy.csv'))
+
+# Longest alias phrase tried inside longer text ("organic basmati rice 1121")
+_MAX_ALIAS_WORDS = 3
+
+# Only ASCII punctuation is stripped so Devanagari/Kannada vowel signs survive
+_PUNCT = re.compile(r'[!-/:-@\[-`{-~]')
+
+
+class Crop:
+    __slots__ = ('id', 'name', 'parent', 'aliases')
+
+    def __init__(self, id, name, parent, aliases):
+        self.id = id
+        self.name = name
+        self.parent = parent
+        self.aliases = aliases
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'parent': self.parent, 'lineage': lineage(self.id)}
+
+
+def normalize(text):
+    text = _PUNCT.sub(' ', str(text or '').casefold().replace('&', ' and '))
+    return ' '.join(text.split())
+
+
+class _Index:
+    """Alias -> crop id map plus the parent links of the category tree."""
+
+    def __init__(self, crops):
+        self.crops = {c.id: c for c in crops}
+        self.by_alias = {}
+        for crop in crops:
+            for alias in [crop.id.replace('_', ' '), crop.name] + crop.aliases:
+                key = normalize(alias)
+                # First definition wins, so an alias shared with a category stays on the category
+                if key and key not in self.by_alias:
+                    self.by_alias[key] = crop.id
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _load():
+    crops = []
+    with open(CROP_TAXONOMY_PATH, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            crops.append(Crop(
+                row['id'].strip(),
+                row['name'].strip(),
+                (row.get('parent') or '').strip() or None,
+                [a.strip() for a in (row.get('aliases') or '').split('|') if a.strip()],
+            ))
+    return _Index(crops)
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = _load()
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Crop taxonomy load error: {e}")
+                    _index = _Index([])
+    return _index
+
+
+@lru_cache(maxsize=4096)
+def resolve(crop_name):
+    """
+    Resolve free-text crop name to a Crop, or None. Tries the whole string, then
+    whole-word alias phrases inside it, longest first ("tea" never matches "teak").
+    """
+    index = get_index()
+    text = normalize(crop_name)
+    if not text:
+        return None
+    crop_id = index.by_alias.get(text)
+    if crop_id is None:
+        words = text.split()
+        for size in range(min(_MAX_ALIAS_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                crop_id = index.by_alias.get(' '.join(words[start:start + size]))
+                if crop_id:
+                    break
+            if crop_id:
+                break
+    return index.crops.get(crop_id) if crop_id else None
+
+
+def canonical_crop(crop_name):
+    """Cache-key form of a crop: the canonical crop id when known, else the normalized text."""
+    crop = resolve(crop_name)
+    return crop.id if crop else ' '.join(str(crop_name or '').lower().split())
+
+
+def crop_id(crop_name):
+    """Canonical crop id, or None for unknown crops."""
+    crop = resolve(crop_name)
+    return crop.id if crop else None
+
+
+def display_crop(crop_name):
+    crop = resolve(crop_name)
+    return crop.name if crop else str(crop_name or '').strip()
+
+
+def lineage(crop_id):
+    """[crop_id, parent, grandparent, ...] up to the top-level category."""
+    crops = get_index().crops
+    chain = []
+    while crop_id and crop_id in crops and crop_id not in chain:
+        chain.append(crop_id)
+        crop_id = crops[crop_id].parent
+    return chain
+
+
+def category(crop_name):
+    """Top-level category id for a crop ("tur" -> "pulses"), or None."""
+    crop = resolve(crop_name)
+    return lineage(crop.id)[-1] if crop else None
+
+
+def children(category_id):
+    """Ids of every crop under a category, including the category itself."""
+    crops = get_index().crops
+    return [c for c in crops if category_id in lineage(c)]
@@ -0,0 +1,196 @@
+import csv
+import difflib
+import math
+import os
+import re
+import threading
+from functools import lru_cache
+
+# Indian states, districts and mandi towns with aliases and coordinates
+GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'gazetteer.csv'))
+FUZZY_CUTOFF = float(os.getenv('GAZETTEER_FUZZY_CUTOFF', '0.85'))
+
+# Words that qualify a district name without changing the place ("Bangalore Urban district")
+_NOISE_WORDS = {'district', 'dist', 'city', 'mandi', 'apmc', 'market', 'india'}
+
+
+class Place:
+    __slots__ = ('name', 'kind', 'state', 'lat', 'lon', 'aliases')
+
+    def __init__(self, name, kind, state, lat, lon, aliases):
+        self.name = name
+        self.kind = kind
+        self.state = state
+        self.lat = lat
+        self.lon = lon
+        self.aliases = aliases
+
+    @property
+    def key(self):
+        """Canonical cache key for this place."""
+        return normalize(self.name)
+
+    @property
+    def display_name(self):
+        if self.kind == 'state' or self.state == self.name:
+            return self.name
+        return f"{self.name}, {self.state}"
+
+    def to_dict(self):
+        return {'name': self.name, 'kind': self.kind, 'state': self.state, 'lat': self.lat, 'lon': self.lon}
+
+
+def normalize(text):
+    text = re.sub(r'[^\w\s]', ' ', str(text or '').lower().replace('&', ' and '))
+    return ' '.join(text.split())
+
+
+class _Index:
+    """Exact alias map, prefix trie for suggestions, and the alias list for fuzzy matching."""
+
+    def __init__(self, places):
+        self.places = places
+        self.by_alias = {}
+        self.trie = {}
+        for place in places:
+            for alias in [place.name] + place.aliases:
+                key = normalize(alias)
+                if not key:
+                    continue
+                # States and districts win over towns sharing a name
+                existing = self.by_alias.get(key)
+                if existing is None or (existing.kind == 'town' and place.kind != 'town'):
+                    self.by_alias[key] = place
+                node = self.trie
+                for ch in key:
+                    node = node.setdefault(ch, {})
+                node.setdefault('$', []).append(place)
+        self.alias_keys = list(self.by_alias)
+
+    def suggest(self, prefix, limit=10):
+        node = self.trie
+        for ch in normalize(prefix):
+            node = node.get(ch)
+            if node is None:
+                return []
+        found = []
+        stack = [node]
+        while stack and len(found) < limit * 4:
+            current = stack.pop()
+            for place in current.get('$', []):
+                if place not in found:
+                    found.append(place)
+            stack.extend(v for k, v in sorted(current.items(), reverse=True) if k != '$')
+        # Districts and mandi towns before states, then alphabetical
+        found.sort(key=lambda p: (p.kind == 'state', p.name))
+        return found[:limit]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _load():
+    places = []
+    with open(GAZETTEER_PATH, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            places.append(Place(
+                row['name'].strip(),
+                row['kind'].strip(),
+                row['state'].strip(),
+                float(row['lat']),
+                float(row['lon']),
+                [a.strip() for a in (row.get('aliases') or '').split('|') if a.strip()],
+            ))
+    return _Index(places)
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = _load()
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Gazetteer load error: {e}")
+                    _index = _Index([])
+    return _index
+
+
+@lru_cache(maxsize=4096)
+def resolve(location):
+    """
+    Resolve free-text location to a Place, or None. Tries the whole string, then each
+    comma-separated part (preferring matches in a named state), then a fuzzy match.
+    """
+    index = get_index()
+    text = normalize(location)
+    if not text:
+        return None
+    place = index.by_alias.get(text)
+    if place:
+        return place
+    parts = [normalize(p) for p in str(location).split(',') if normalize(p)]
+    candidates = []
+    unmatched = False
+    for part in parts:
+        stripped = ' '.join(w for w in part.split() if w not in _NOISE_WORDS)
+        for key in (part, stripped):
+            if key and key in index.by_alias:
+                candidates.append(index.by_alias[key])
+                break
+        else:
+            unmatched = True
+    if candidates:
+        states = {p.name for p in candidates if p.kind == 'state'}
+        for place in candidates:
+            if place.kind != 'state' and (not states or place.state in states):
+                return place
+        # "Some village, Karnataka" is not Karnataka, and "Aurangabad, Bihar" is not the
+        # Maharashtra district: keep unknown places distinct
+        if unmatched or any(p.kind != 'state' for p in candidates):
+            return None
+        return candidates[0]
+    first = parts[0] if parts else text
+    stripped = ' '.join(w for w in first.split() if w not in _NOISE_WORDS)
+    close = difflib.get_close_matches(stripped or first, index.alias_keys, n=1, cutoff=FUZZY_CUTOFF)
+    return index.by_alias[close[0]] if close else None
+
+
+def canonical_location(location):
+    """Cache-key form of a location: the canonical place key when known, else the normalized text."""
+    place = resolve(location)
+    return place.key if place else ' '.join(str(location or '').lower().split())
+
+
+def display_location(location):
+    """Human/LLM-facing form ("Bengaluru, Karnataka") when known, else the input as given."""
+    place = resolve(location)
+    return place.display_name if place else str(location or '').strip()
+
+
+def coordinates(location):
+    """(lat, lon) for a known location, else None."""
+    place = resolve(location)
+    return (place.lat, place.lon) if place else None
+
+
+def suggest(prefix, limit=10):
+    return get_index().suggest(prefix, limit)
+
+
+def nearest(lat, lon, max_km=None):
+    """Closest district or town to a point (haversine), or None if none lies within max_km."""
+    best, best_km = None, None
+    for place in get_index().places:
+        if place.kind == 'state':
+            continue
+        p1, p2 = math.radians(lat), math.radians(place.lat)
+        a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(place.lon - lon) / 2) ** 2
+        km = 12742 * math.asin(math.sqrt(a))
+        if best_km is None or km < best_km:
+            best, best_km = place, km
+    if best is None or (max_km is not None and best_km > max_km):
+        return None
+    return best
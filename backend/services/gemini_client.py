@@ -0,0 +1,191 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared, keep-alive HTTP client for every Gemini call in the backend.
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+GEMINI_BASE_URL = 'https://generativelanguage.googleapis.com/v1/models'
+
+# (connect, read) timeouts in seconds per Gemini endpoint
+GEMINI_TIMEOUTS = {
+    'generateContent': (
+        float(os.getenv('GEMINI_CONNECT_TIMEOUT', '3.05')),
+        float(os.getenv('GEMINI_READ_TIMEOUT', '30')),
+    ),
+    # Read timeout here bounds the gap between streamed chunks, not the whole answer
+    'streamGenerateContent': (
+        float(os.getenv('GEMINI_CONNECT_TIMEOUT', '3.05')),
+        float(os.getenv('GEMINI_STREAM_READ_TIMEOUT', '15')),
+    ),
+}
+
+# Bounded retries with jittered exponential backoff on 429/5xx
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '2'))
+GEMINI_BACKOFF_BASE = float(os.getenv('GEMINI_BACKOFF_BASE', '0.5'))
+GEMINI_BACKOFF_MAX = float(os.getenv('GEMINI_BACKOFF_MAX', '4'))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Pool sized for gunicorn gthread workers (threads per worker plus background jobs)
+GEMINI_POOL_SIZE = int(os.getenv('GEMINI_POOL_SIZE', '8'))
+
+_session = None
+_session_lock = threading.Lock()
+
+# Latency record of the most recent calls in this process
+_calls = deque(maxlen=int(os.getenv('GEMINI_CALL_LOG_SIZE', '200')))
+_calls_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use (after fork)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=GEMINI_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def model_url(method, model=None):
+    return f"{GEMINI_BASE_URL}/{model or GEMINI_MODEL}:{method}"
+
+
+def _backoff_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(float(retry_after), GEMINI_BACKOFF_MAX)
+        except ValueError:
+            pass
+    # Full jitter: uniform between 0 and the capped exponential step
+    return random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * (2 ** attempt)))
+
+
+def record_call(method, model, status, attempts, elapsed_ms, **extra):
+    entry = {
+        'method': method,
+        'model': model,
+        'status': status,
+        'attempts': attempts,
+        'elapsed_ms': round(elapsed_ms, 1),
+        'ts': time.time(),
+    }
+    entry.update(extra)
+    with _calls_lock:
+        _calls.append(entry)
+    print(f"[LOG] Gemini {method} model={model} status={status} attempts={attempts} elapsed_ms={entry['elapsed_ms']}")
+
+
+def post(method, payload, model=None, params=None, stream=False, record=True):
+    """POST to a Gemini model endpoint through the shared session.
+
+    Retries connection errors and 429/5xx responses with jittered backoff and
+    records the call latency. Returns the final requests.Response; raises the
+    last requests exception if every attempt failed to connect or timed out.
+    """
+    model = model or GEMINI_MODEL
+    query = {'key': os.getenv('GEMINI_API_KEY')}
+    if params:
+        query.update(params)
+    timeout = GEMINI_TIMEOUTS.get(method, GEMINI_TIMEOUTS['generateContent'])
+    session = get_session()
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            response = session.post(model_url(method, model), params=query, json=payload, timeout=timeout, stream=stream)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # A read timeout means the request reached Gemini; do not pay for it twice
+            retryable = not isinstance(e, requests.ReadTimeout)
+            if not retryable or attempt > GEMINI_MAX_RETRIES:
+                record_call(method, model, type(e).__name__, attempt, (time.perf_counter() - started) * 1000)
+                raise
+            time.sleep(_backoff_delay(attempt - 1))
+            continue
+        if response.status_code in RETRY_STATUSES and attempt <= GEMINI_MAX_RETRIES:
+            delay = _backoff_delay(attempt - 1, response.headers.get('Retry-After'))
+            response.close()
+            time.sleep(delay)
+            continue
+        if record or not response.ok:
+            record_call(method, model, response.status_code, attempt, (time.perf_counter() - started) * 1000)
+        response.attempts = attempt
+        return response
+
+
+def generate_content(prompt, model=None):
+    """Send a single-turn text prompt to generateContent and return the Response."""
+    return post('generateContent', {"contents": [{"parts": [{"text": prompt}]}]}, model=model)
+
+
+def stream_content(prompt, model=None):
+    """Yield text chunks from streamGenerateContent (Server-Sent Events) as they arrive.
+
+    Raises requests.HTTPError on a non-2xx status. Time to first chunk and total
+    duration are added to the call record once the stream is finished.
+    """
+    model = model or GEMINI_MODEL
+    started = time.perf_counter()
+    response = post(
+        'streamGenerateContent',
+        {"contents": [{"parts": [{"text": prompt}]}]},
+        model=model, params={'alt': 'sse'}, stream=True, record=False
+    )
+    if not response.ok:
+        print("Gemini API error:", response.status_code, response.text)
+        response.raise_for_status()
+    ttfb_ms = None
+    status = response.status_code
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            chunk = json.loads(line[5:])
+            for candidate in chunk.get('candidates', [])[:1]:
+                for part in candidate.get('content', {}).get('parts', []):
+                    text = part.get('text')
+                    if text:
+                        if ttfb_ms is None:
+                            ttfb_ms = round((time.perf_counter() - started) * 1000, 1)
+                        yield text
+    except requests.RequestException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        response.close()
+        record_call('streamGenerateContent', model, status, response.attempts, (time.perf_counter() - started) * 1000, ttfb_ms=ttfb_ms)
+
+
+def response_text(response):
+    return response.json()['candidates'][0]['content']['parts'][0]['text']
+
+
+def get_call_stats():
+    """Summarize the recent call log (count, error count, latency percentiles)."""
+    with _calls_lock:
+        calls = list(_calls)
+    latencies = sorted(c['elapsed_ms'] for c in calls)
+
+    def pct(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+        'calls': len(calls),
+        'errors': sum(1 for c in calls if c['status'] != 200),
+        'retried': sum(1 for c in calls if c['attempts'] > 1),
+        'p50_ms': pct(0.5),
+        'p95_ms': pct(0.95),
+        'max_ms': latencies[-1] if latencies else None,
+        'recent': calls[-10:],
+    }
@@ -1,15 +1,40 @@
+import hashlib
+import json
 import os
 import requests
-import json
 
-# Allow configuring model; default to cost-efficient Flash 2.0
-GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
-GEMINI_API_URL = f'https://generativelanguage.googleapis.com/v1/models/{GEMINI_MODEL}:generateContent'
+# Model is configured in the shared client (GEMINI_MODEL, default cost-efficient Flash 2.0)
+from services.gemini_client import GEMINI_MODEL, generate_content, response_text, stream_content
+from services.cache_store import CacheStore, make_key
+from services.singleflight import SingleFlight, SingleFlightTimeout
+from services.gazetteer import canonical_location
+from services.crop_taxonomy import lineage, resolve as resolve_crop
+
+# Persistent answer cache for repeated chatbot questions and tips (shared by workers)
+gemini_cache = CacheStore(
+    'gemini',
+    ttl_seconds=int(float(os.getenv('GEMINI_CACHE_TTL_HOURS', '24')) * 3600),
+    max_entries=int(os.getenv('GEMINI_CACHE_MAX_ENTRIES', '5000')),
+    max_bytes=int(os.getenv('GEMINI_CACHE_MAX_MB', '32')) * 1024 * 1024,
+)
+
+
+def normalize_prompt(text):
+    """Case-fold, collapse whitespace and drop trailing punctuation so trivially different questions share a key."""
+    return ' '.join((text or '').casefold().split()).rstrip(' ?!.')
+
+
+def gemini_cache_key(kind, text, language='en'):
+    digest = hashlib.sha256(normalize_prompt(text).encode('utf-8')).hexdigest()
+    return make_key(kind, GEMINI_MODEL, language, digest)
 
 # Utility for Gemini API call
 
+NO_RECOMMENDATION_TABLE = "| Crop | Yield (quintals/hectare) | Duration (days) |\n|------|--------------------------|------------------|\n| No data available | - | - |"
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv('SINGLEFLIGHT_WAIT_SECONDS', '40'))
+recommend_flight = SingleFlight('crop_recommend')
+
 def get_crop_recommendation(data):
-    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     soil = data.get('soil')
     season = data.get('season')
     location = data.get('location')
@@ -21,26 +46,41 @@ def get_crop_recommendation(data):
         "Return your answer as a markdown table with columns: Crop, Yield (quintals/hectare), Duration (days).\n"
         "Do not include any explanations, background, or extra text. Only output the table."
     )
+    # Identical soil/season/location requests in flight share one Gemini call
+    key = (str(soil or '').strip().lower(), str(season or '').strip().lower(), canonical_location(location) if location else '')
+    try:
+        return recommend_flight.do(key, lambda: _recommend(prompt), timeout=SINGLEFLIGHT_WAIT_SECONDS)
+    except SingleFlightTimeout as e:
+        print("Gemini API exception:", str(e))
+        return {"table": NO_RECOMMENDATION_TABLE}
+
+def _recommend(prompt):
     try:
-        response = requests.post(
-            f"{GEMINI_API_URL}?key={GEMINI_API_KEY}",
-            json={
-                "contents": [{"parts": [{"text": prompt}]}]
-            }
-        )
+        response = generate_content(prompt)
         if response.ok:
-            text = response.json()['candidates'][0]['content']['parts'][0]['text']
-            # Only return the markdown table
-            return {"table": text.strip()}
+            text = response_text(response)
+            # Only return the markdown table, plus the canonical crop id of each row
+            return {"table": text.strip(), "crops": _table_crops(text)}
         else:
             print("Gemini API error:", response.status_code, response.text)
-            return {"table": "| Crop | Yield (quintals/hectare) | Duration (days) |\n|------|--------------------------|------------------|\n| No data available | - | - |"}
+            return {"table": NO_RECOMMENDATION_TABLE}
     except Exception as e:
         print("Gemini API exception:", str(e))
-        return {"table": "| Crop | Yield (quintals/hectare) | Duration (days) |\n|------|--------------------------|------------------|\n| No data available | - | - |"}
+        return {"table": NO_RECOMMENDATION_TABLE}
 
-def ask_gemini(message, language='en'):
-    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+def _table_crops(table):
+    """[{name, crop_id, category}] for the first column of a markdown recommendation table."""
+    crops = []
+    for line in table.splitlines():
+        cells = [c.strip() for c in line.strip().strip('|').split('|')]
+        name = cells[0] if cells else ''
+        if not name or name.lower() == 'crop' or set(name) <= set('-: '):
+            continue
+        crop = resolve_crop(name)
+        crops.append({'name': name, 'crop_id': crop.id if crop else None, 'category': lineage(crop.id)[-1] if crop else None})
+    return crops
+
+def _chat_prompt(message, language):
     # System/context prompt for the chatbot
     system_prompt = (
         "You are AgriGuru, an AI assistant for Indian farmers. "
@@ -51,34 +91,66 @@ def ask_gemini(message, language='en'):
     )
     # Compose the full prompt
     if language == 'hi':
-        prompt = f"{system_prompt}\nPlease answer in Hindi: {message}"
+        return f"{system_prompt}\nPlease answer in Hindi: {message}"
     elif language == 'kn':
-        prompt = f"{system_prompt}\nPlease answer in Kannada: {message}"
+        return f"{system_prompt}\nPlease answer in Kannada: {message}"
     else:
-        prompt = f"{system_prompt}\n{message}"
-    response = requests.post(
-        f"{GEMINI_API_URL}?key={GEMINI_API_KEY}",
-        json={
-            "contents": [{"parts": [{"text": prompt}]}]
-        }
-    )
+        return f"{system_prompt}\n{message}"
+
+def ask_gemini(message, language='en', cache=True):
+    prompt = _chat_prompt(message, language)
+    key = gemini_cache_key('ask', message, language if language in ('hi', 'kn') else 'en')
+    if cache:
+        cached = gemini_cache.get(key)
+        if cached is not None:
+            return cached
+    try:
+        response = generate_content(prompt)
+    except requests.RequestException as e:
+        print("Gemini API exception:", str(e))
+        return f"Gemini API error: {type(e).__name__}"
     if response.ok:
-        return response.json()['candidates'][0]['content']['parts'][0]['text']
+        answer = response_text(response)
+        if cache:
+            gemini_cache.set(key, answer)
+        return answer
     else:
         print("Gemini API error:", response.status_code, response.text)
         return f"Gemini API error: {response.status_code} {response.text}"
 
+def ask_gemini_stream(message, language='en'):
+    """Streaming variant of ask_gemini: yields answer chunks as Gemini produces them.
+
+    A cached answer is yielded in one piece; a completed stream is stored in the
+    same cache as ask_gemini. Upstream errors are raised as requests exceptions.
+    """
+    key = gemini_cache_key('ask', message, language if language in ('hi', 'kn') else 'en')
+    cached = gemini_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    for chunk in stream_content(_chat_prompt(message, language)):
+        parts.append(chunk)
+        yield chunk
+    if parts:
+        gemini_cache.set(key, ''.join(parts))
+
 def get_ai_tips(category=None, stage=None):
-    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     prompt = f"Give organic farming tips for {category or 'any crop'} at {stage or 'any stage'}."
-    response = requests.post(
-        f"{GEMINI_API_URL}?key={GEMINI_API_KEY}",
-        json={
-            "contents": [{"parts": [{"text": prompt}]}]
-        }
-    )
+    key = gemini_cache_key('tips', prompt)
+    cached = gemini_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        response = generate_content(prompt)
+    except requests.RequestException as e:
+        print("Gemini API exception:", str(e))
+        return f"Gemini API error: {type(e).__name__}"
     if response.ok:
-        return response.json()['candidates'][0]['content']['parts'][0]['text']
+        tips = response_text(response)
+        gemini_cache.set(key, tips)
+        return tips
     else:
         print("Gemini API error:", response.status_code, response.text)
         return f"Gemini API error: {response.status_code} {response.text}"
@@ -89,7 +161,6 @@ def verify_equipment_certification(info: dict):
     Accepts keys: equipment_id, equipment_name, brand, origin, compliance_info, extra
     Returns dict: { status: 'Likely Certified'|'Likely Not Certified'|'unknown', explanation: str, confidence: float|None }
     """
-    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     # Accept both new equipment_* and legacy product/crop fields for compatibility
     equipment_id = (info.get('equipment_id') or info.get('product_id') or '').strip()
     equipment_name = (info.get('equipment_name') or info.get('crop_name') or '').strip()
@@ -116,16 +187,11 @@ def verify_equipment_certification(info: dict):
     )
 
     try:
-        response = requests.post(
-            f"{GEMINI_API_URL}?key={GEMINI_API_KEY}",
-            json={
-                "contents": [{"parts": [{"text": prompt}]}]
-            }
-        )
+        response = generate_content(prompt)
         if not response.ok:
             print("Gemini API error:", response.status_code, response.text)
             return {"status": "unknown", "explanation": "Verification service unavailable.", "confidence": None}
-        text = response.json()['candidates'][0]['content']['parts'][0]['text']
+        text = response_text(response)
         # Try to parse JSON strictly; fallback to heuristic
         try:
             data = json.loads(text)
@@ -0,0 +1,148 @@
+import argparse
+import csv
+import os
+
+import requests
+
+from services.cache_store import CacheStore
+from services.singleflight import SingleFlight, SingleFlightTimeout
+from services.gazetteer import normalize, resolve, nearest
+from services.openweather_client import OPENWEATHER_GEOCODE_URL, get as openweather_get
+
+# Persistent geocode cache (SQLite, all workers): normalized location -> {lat, lon, ...} or a miss marker
+GEOCODE_TTL_DAYS = float(os.getenv('GEOCODE_TTL_DAYS', '90'))
+# Names OpenWeather does not know are remembered for a day; upstream failures only briefly
+GEOCODE_NEGATIVE_TTL_HOURS = float(os.getenv('GEOCODE_NEGATIVE_TTL_HOURS', '24'))
+GEOCODE_ERROR_TTL_SECONDS = int(os.getenv('GEOCODE_ERROR_TTL_SECONDS', '300'))
+# Pre-seeded coordinates are trusted for years
+GEOCODE_SEED_TTL_DAYS = float(os.getenv('GEOCODE_SEED_TTL_DAYS', '3650'))
+# Unknown places within this distance of a gazetteer district/town share its market (price) data
+GEOCODE_SNAP_KM = float(os.getenv('GEOCODE_SNAP_KM', '40'))
+
+geocode_cache = CacheStore(
+    'geocode',
+    ttl_seconds=int(GEOCODE_TTL_DAYS * 86400),
+    max_entries=int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', '200000')),
+    max_bytes=int(os.getenv('GEOCODE_CACHE_MAX_MB', '64')) * 1024 * 1024,
+)
+geocode_flight = SingleFlight('geocode', shared=True, lease_seconds=15)
+GEOCODE_WAIT_SECONDS = float(os.getenv('GEOCODE_WAIT_SECONDS', '12'))
+
+# Only geocode inside India
+COUNTRY_CODE = 'IN'
+
+
+def _fetch(key, location):
+    cached = geocode_cache.get(key, count=False)
+    if cached is not None:
+        return cached
+    try:
+        resp = openweather_get(OPENWEATHER_GEOCODE_URL, {'q': f"{location},{COUNTRY_CODE}", 'limit': 1})
+    except requests.RequestException as e:
+        print(f"Geocode error: {e}")
+        result = {'found': False, 'error': type(e).__name__}
+        geocode_cache.set(key, result, ttl_seconds=GEOCODE_ERROR_TTL_SECONDS)
+        return result
+    if not resp.ok:
+        print("Geocode error:", resp.status_code, resp.text[:200])
+        result = {'found': False, 'error': resp.status_code}
+        geocode_cache.set(key, result, ttl_seconds=GEOCODE_ERROR_TTL_SECONDS)
+        return result
+    matches = resp.json() or []
+    match = matches[0] if matches else {}
+    if match.get('lat') is None or match.get('lon') is None:
+        result = {'found': False}
+        geocode_cache.set(key, result, ttl_seconds=int(GEOCODE_NEGATIVE_TTL_HOURS * 3600))
+        return result
+    result = {'found': True, 'lat': match['lat'], 'lon': match['lon'], 'name': match.get('name'), 'state': match.get('state'), 'source': 'openweather'}
+    geocode_cache.set(key, result)
+    return result
+
+
+def lookup(location):
+    """Cached geocode result dict ({'found': bool, 'lat', 'lon', ...}) for a location name."""
+    key = normalize(location)
+    if not key:
+        return {'found': False}
+    result = geocode_cache.get(key)
+    if result is not None:
+        return result
+    try:
+        return geocode_flight.do(
+            key, lambda: _fetch(key, location),
+            timeout=GEOCODE_WAIT_SECONDS,
+            recheck=lambda: geocode_cache.get(key, count=False),
+        ) or {'found': False}
+    except SingleFlightTimeout:
+        return {'found': False}
+
+
+def geocode(location):
+    """(lat, lon) for a location: gazetteer first, then the persistent cache/OpenWeather. None if unknown."""
+    place = resolve(location)
+    if place:
+        return place.lat, place.lon
+    result = lookup(location)
+    return (result['lat'], result['lon']) if result.get('found') else None
+
+
+def cached_coordinates(location):
+    """(lat, lon) from the gazetteer or the geocode cache only; never calls OpenWeather."""
+    place = resolve(location)
+    if place:
+        return place.lat, place.lon
+    key = normalize(location)
+    result = geocode_cache.get(key, count=False) if key else None
+    return (result['lat'], result['lon']) if result and result.get('found') else None
+
+
+def market_location(location, cached_only=False):
+    """
+    The location to use for market (price) data: unknown villages map to the nearest
+    gazetteer district or town within GEOCODE_SNAP_KM, so they share its cache entries.
+    With cached_only, places not geocoded yet are returned as given (no network call).
+    """
+    if resolve(location):
+        return location
+    coords = cached_coordinates(location) if cached_only else geocode(location)
+    place = nearest(*coords, max_km=GEOCODE_SNAP_KM) if coords else None
+    return place.display_name if place else location
+
+
+def seed(path, batch_size=1000):
+    """Bulk-load name,lat,lon[,state] rows into the cache. Returns (loaded, skipped)."""
+    loaded = skipped = 0
+    ttl = int(GEOCODE_SEED_TTL_DAYS * 86400)
+    batch = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            name = (row.get('name') or '').strip()
+            state = (row.get('state') or '').strip() or None
+            try:
+                lat, lon = float(row['lat']), float(row['lon'])
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+            if not normalize(name):
+                skipped += 1
+                continue
+            value = {'found': True, 'lat': lat, 'lon': lon, 'name': name, 'state': state, 'source': 'seed'}
+            # Village names repeat across states: store "name, state" as well as the bare name
+            batch.append((normalize(name), value))
+            if state:
+                batch.append((normalize(f"{name}, {state}"), value))
+            loaded += 1
+            if len(batch) >= batch_size:
+                geocode_cache.set_many(batch, ttl_seconds=ttl)
+                batch = []
+    geocode_cache.set_many(batch, ttl_seconds=ttl)
+    return loaded, skipped
+
+
+if __name__ == '__main__':
+    # python -m services.geocoder villages.csv   (columns: name,lat,lon[,state])
+    parser = argparse.ArgumentParser(description='Pre-seed the geocode cache from a CSV of place coordinates')
+    parser.add_argument('csv', help='CSV with name,lat,lon and optional state columns')
+    args = parser.parse_args()
+    loaded, skipped = seed(args.csv)
+    print(f"Seeded {loaded} places ({skipped} rows skipped)")
@@ -0,0 +1,284 @@
+import argparse
+import math
+import os
+import struct
+import threading
+import time
+from datetime import date
+
+import numpy as np
+
+# Gridded NDVI over India in one memory-mapped file, shared by all workers via the page cache
+NDVI_RASTER_PATH = os.getenv('NDVI_RASTER_PATH', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'ndvi.grid'))
+# How often a worker checks whether the ingest tool replaced the file
+NDVI_RELOAD_SECONDS = float(os.getenv('NDVI_RELOAD_SECONDS', '60'))
+
+# Header: magic, version, rows, cols, south, west, north, east, scale, nodata, acquisition date
+MAGIC = b'NDVI'
+VERSION = 1
+_HEADER = struct.Struct('<4sH2xIIddddfh10s')
+HEADER_SIZE = 64
+# Cells are little-endian int16, row 0 at the north edge; ndvi = cell / scale
+DTYPE = np.dtype('<i2')
+DEFAULT_SCALE = 10000.0
+NODATA = -32768
+
+# Default grid for ingest: India at ~1 km
+INDIA_BOUNDS = (6.0, 68.0, 38.0, 98.0)
+
+KM_PER_DEGREE = 111.32
+
+
+class NdviRaster:
+    """Read-only view of an NDVI grid file. Point lookups are O(1) index arithmetic on the mmap."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"{path}: truncated header")
+        magic, version, rows, cols, south, west, north, east, scale, nodata, acquired = _HEADER.unpack_from(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not an NDVI grid (version {version})")
+        self.rows, self.cols = rows, cols
+        self.south, self.west, self.north, self.east = south, west, north, east
+        self.scale = scale
+        self.nodata = nodata
+        self.date = acquired.rstrip(b'\0').decode('ascii')
+        self.res_lat = (north - south) / rows
+        self.res_lon = (east - west) / cols
+        self.cells = np.memmap(path, dtype=DTYPE, mode='r', offset=HEADER_SIZE, shape=(rows, cols))
+
+    def header(self):
+        return {
+            'bounds': {'south': self.south, 'west': self.west, 'north': self.north, 'east': self.east},
+            'resolution': {'lat': self.res_lat, 'lon': self.res_lon},
+            'shape': [self.rows, self.cols],
+            'date': self.date,
+        }
+
+    def cell_indices(self, lats, lons):
+        """
+        (rows, cols, inside) for arrays of points. A cell owns its north and west edges:
+        south < lat <= north and west <= lon < east are inside; indices are clamped so
+        float rounding next to an edge never leaves the grid.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        inside = (lats > self.south) & (lats <= self.north) & (lons >= self.west) & (lons < self.east)
+        with np.errstate(invalid='ignore'):
+            rows = np.clip(np.floor((self.north - lats) / self.res_lat), 0, self.rows - 1).astype(np.int64)
+            cols = np.clip(np.floor((lons - self.west) / self.res_lon), 0, self.cols - 1).astype(np.int64)
+        return rows, cols, inside
+
+    def cell_index(self, lat, lon):
+        """(row, col) of the cell containing the point, or None outside the grid."""
+        rows, cols, inside = self.cell_indices(lat, lon)
+        if not inside:
+            return None
+        return int(rows), int(cols)
+
+    def value(self, lat, lon):
+        """NDVI at a point, or None outside the grid or over nodata cells."""
+        index = self.cell_index(lat, lon)
+        if index is None:
+            return None
+        raw = int(self.cells[index])
+        return None if raw == self.nodata else raw / self.scale
+
+    def values(self, lats, lons):
+        """Vectorized point lookup; NaN outside the grid or over nodata."""
+        rows, cols, inside = self.cell_indices(lats, lons)
+        raw = self.cells[rows, cols]
+        out = raw / self.scale
+        out[~inside | (raw == self.nodata)] = np.nan
+        return out
+
+    def check_edges(self):
+        """Point lookups on the grid's edges and corners agree between value() and values()."""
+        eps = min(self.res_lat, self.res_lon) * 1e-6
+        points = [
+            (self.north, self.west, (0, 0)),
+            (self.south + eps, self.west, (self.rows - 1, 0)),
+            (self.north, self.east - eps, (0, self.cols - 1)),
+            (self.south + eps, self.east - eps, (self.rows - 1, self.cols - 1)),
+            (self.south, self.west, None),
+            (self.north, self.east, None),
+        ]
+        batch = self.values([p[0] for p in points], [p[1] for p in points])
+        for (lat, lon, expected), vector in zip(points, batch):
+            if self.cell_index(lat, lon) != expected:
+                raise ValueError(f'cell_index({lat}, {lon}) != {expected}')
+            scalar = self.value(lat, lon)
+            if (scalar is None) != bool(np.isnan(vector)) or (scalar is not None and scalar != vector):
+                raise ValueError(f'value() and values() disagree at ({lat}, {lon})')
+
+    def window_slices(self, south, west, north, east):
+        """Row/column slices covering a lat/lon box, clipped to the grid (may be empty)."""
+        r0 = max(0, int(math.floor((self.north - north) / self.res_lat)))
+        r1 = min(self.rows, int(math.ceil((self.north - south) / self.res_lat)))
+        c0 = max(0, int(math.floor((west - self.west) / self.res_lon)))
+        c1 = min(self.cols, int(math.ceil((east - self.west) / self.res_lon)))
+        return slice(r0, max(r0, r1)), slice(c0, max(c0, c1))
+
+    def _read(self, rows, cols):
+        raw = np.asarray(self.cells[rows, cols])
+        out = raw / self.scale
+        out[raw == self.nodata] = np.nan
+        return out
+
+    def window(self, south, west, north, east):
+        """NDVI array (NaN for nodata) for a lat/lon box; reads only the rows it covers."""
+        return self._read(*self.window_slices(south, west, north, east))
+
+    def polygon_values(self, ring, max_cells=None):
+        """
+        NDVI of the cells whose centres fall inside a polygon ring [(lon, lat), ...].
+        The ring is rasterized over its bounding window with one vectorized test per edge.
+        """
+        ring = np.asarray(ring, dtype=float)
+        rows, cols = self.window_slices(ring[:, 1].min(), ring[:, 0].min(), ring[:, 1].max(), ring[:, 0].max())
+        size = (rows.stop - rows.start) * (cols.stop - cols.start)
+        if max_cells is not None and size > max_cells:
+            raise ValueError(f'polygon covers {size} cells (limit {max_cells})')
+        lats = self.north - (np.arange(rows.start, rows.stop) + 0.5) * self.res_lat
+        lons = self.west + (np.arange(cols.start, cols.stop) + 0.5) * self.res_lon
+        lon_grid, lat_grid = np.meshgrid(lons, lats)
+        return self._read(rows, cols)[point_in_polygon(lon_grid, lat_grid, ring)]
+
+    def window_stats(self, lat, lon, radius_km=1.0):
+        """mean/min/max/std and cell counts of NDVI in a square of +-radius_km around a point."""
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        return summarize(self.window(lat - dlat, lon - dlon, lat + dlat, lon + dlon))
+
+
+def point_in_polygon(xs, ys, ring):
+    """Even-odd rule for arrays of points against one ring [(x, y), ...]; loops over edges, not points."""
+    ring = np.asarray(ring, dtype=float)
+    inside = np.zeros(np.shape(xs), dtype=bool)
+    for (ax, ay), (bx, by) in zip(ring, np.roll(ring, -1, axis=0)):
+        if ay == by:
+            continue
+        crosses = (ay > ys) != (by > ys)
+        inside ^= crosses & (xs < ax + (ys - ay) * (bx - ax) / (by - ay))
+    return inside
+
+
+def summarize(values):
+    values = np.asarray(values, dtype=float)
+    valid = values[~np.isnan(values)]
+    if not valid.size:
+        return {'mean': None, 'min': None, 'max': None, 'std': None, 'cells': int(values.size), 'valid_cells': 0}
+    return {
+        'mean': round(float(valid.mean()), 3),
+        'min': round(float(valid.min()), 3),
+        'max': round(float(valid.max()), 3),
+        'std': round(float(valid.std()), 3),
+        'cells': int(values.size),
+        'valid_cells': int(valid.size),
+    }
+
+
+_raster = None
+_raster_lock = threading.Lock()
+_checked_at = 0.0
+_mtime = None
+
+
+def get_raster():
+    """The current NdviRaster, or None when no grid file has been ingested."""
+    global _raster, _checked_at, _mtime
+    now = time.monotonic()
+    if _checked_at and now - _checked_at < NDVI_RELOAD_SECONDS:
+        return _raster
+    with _raster_lock:
+        if _checked_at and now - _checked_at < NDVI_RELOAD_SECONDS:
+            return _raster
+        _checked_at = now
+        try:
+            mtime = os.stat(NDVI_RASTER_PATH).st_mtime
+        except OSError:
+            _raster, _mtime = None, None
+            return None
+        if mtime != _mtime:
+            try:
+                _raster = NdviRaster(NDVI_RASTER_PATH)
+                _mtime = mtime
+                print(f"[LOG] NDVI raster loaded: {_raster.header()}")
+            except (OSError, ValueError) as e:
+                print(f"NDVI raster load error: {e}")
+                _raster, _mtime = None, None
+    return _raster
+
+
+def write_raster(path, ndvi, bounds, acquired=None, scale=DEFAULT_SCALE):
+    """
+    Write an NDVI array (rows from north to south; NaN = nodata) as a grid file.
+    bounds: (south, west, north, east). The file is replaced atomically, so running
+    workers keep their old mapping until they reload.
+    """
+    ndvi = np.asarray(ndvi, dtype=float)
+    if ndvi.ndim != 2:
+        raise ValueError('NDVI array must be 2-D')
+    south, west, north, east = (float(b) for b in bounds)
+    if not (south < north and west < east):
+        raise ValueError('bounds must be south < north and west < east')
+    cells = np.full(ndvi.shape, NODATA, dtype=DTYPE)
+    valid = ~np.isnan(ndvi)
+    cells[valid] = np.round(np.clip(ndvi[valid], -1, 1) * scale).astype(DTYPE)
+    acquired = str(acquired or date.today().isoformat())[:10].encode('ascii')
+    header = _HEADER.pack(MAGIC, VERSION, ndvi.shape[0], ndvi.shape[1], south, west, north, east, scale, NODATA, acquired)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        cells.tofile(f)
+    os.replace(tmp, path)
+
+
+def _read_geotiff(path):
+    """(ndvi array, bounds) from a single-band GeoTIFF in EPSG:4326. Needs rasterio."""
+    try:
+        import rasterio
+    except ImportError:
+        raise SystemExit('Reading GeoTIFF needs rasterio (pip install rasterio), or export the band to .npy')
+    with rasterio.open(path) as src:
+        band = src.read(1, masked=True).astype(float).filled(np.nan)
+        b = src.bounds
+        return band, (b.bottom, b.left, b.top, b.right)
+
+
+def _read_array(path):
+    """NDVI array from .npy; integer arrays are taken as NDVI x 10000 (the MODIS convention)."""
+    band = np.load(path)
+    if np.issubdtype(band.dtype, np.integer):
+        band = np.where(band == NODATA, np.nan, band / DEFAULT_SCALE)
+    return band.astype(float)
+
+
+def ingest(source, output=None, bounds=None, acquired=None):
+    if source.lower().endswith(('.tif', '.tiff')):
+        ndvi, source_bounds = _read_geotiff(source)
+        bounds = bounds or source_bounds
+    else:
+        ndvi = _read_array(source)
+        bounds = bounds or INDIA_BOUNDS
+    output = output or NDVI_RASTER_PATH
+    write_raster(output, ndvi, bounds, acquired)
+    raster = NdviRaster(output)
+    raster.check_edges()
+    print(f"Wrote {output}: {raster.header()}")
+
+
+if __name__ == '__main__':
+    # python -m services.ndvi_raster ndvi.tif --date 2025-08-01
+    # python -m services.ndvi_raster ndvi.npy --bounds 6 68 38 98 --date 2025-08-01
+    parser = argparse.ArgumentParser(description='Build the NDVI grid file from a GeoTIFF or NumPy array')
+    parser.add_argument('source', help='.tif/.tiff (EPSG:4326, needs rasterio) or .npy (rows north to south)')
+    parser.add_argument('--output', help=f'grid file to write (default {NDVI_RASTER_PATH})')
+    parser.add_argument('--bounds', nargs=4, type=float, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'),
+                        help='geographic bounds of the array (default: GeoTIFF bounds, or India for .npy)')
+    parser.add_argument('--date', help='acquisition date YYYY-MM-DD (default today)')
+    args = parser.parse_args()
+    ingest(args.source, args.output, args.bounds, args.date)
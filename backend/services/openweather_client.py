@@ -0,0 +1,36 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared, keep-alive HTTP client for OpenWeather (forecast and geocoding)
+OPENWEATHER_FORECAST_URL = 'https://api.openweathermap.org/data/2.5/forecast'
+OPENWEATHER_GEOCODE_URL = 'https://api.openweathermap.org/geo/1.0/direct'
+
+# (connect, read) timeouts in seconds for OpenWeather calls
+WEATHER_TIMEOUT = (
+    float(os.getenv('WEATHER_CONNECT_TIMEOUT', '3.05')),
+    float(os.getenv('WEATHER_READ_TIMEOUT', '10')),
+)
+WEATHER_POOL_SIZE = int(os.getenv('WEATHER_POOL_SIZE', '8'))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide keep-alive session for OpenWeather."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=WEATHER_POOL_SIZE, max_retries=1))
+                _session = session
+    return _session
+
+
+def get(url, params):
+    """GET an OpenWeather endpoint with the API key and timeouts. Raises requests exceptions."""
+    return get_session().get(url, params=dict(params, appid=os.getenv('OPENWEATHER_API_KEY')), timeout=WEATHER_TIMEOUT)
@@ -0,0 +1,221 @@
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+from services.gazetteer import canonical_location
+from services.crop_taxonomy import canonical_crop
+
+# Durable mandi price time series (separate from the disposable cache.db)
+PRICE_HISTORY_DB_PATH = os.getenv('PRICE_HISTORY_DB_PATH', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prices.db'))
+
+# Dictionary-encoded name kinds; rows store small integer ids instead of repeated strings
+KIND_CROP, KIND_LOCATION, KIND_MANDI, KIND_SOURCE = 1, 2, 3, 4
+
+EPOCH = date(1970, 1, 1)
+BUCKETS = ('raw', 'daily', 'weekly')
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+_name_ids = {}
+_write_lock = threading.Lock()
+
+
+def get_conn():
+    global _schema_ready
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(PRICE_HISTORY_DB_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.execute(
+                    '''CREATE TABLE IF NOT EXISTS ts_names (
+                        id INTEGER PRIMARY KEY,
+                        kind INTEGER NOT NULL,
+                        name TEXT NOT NULL,
+                        UNIQUE (kind, name)
+                    )'''
+                )
+                # Clustered on the query path: one crop/location's days are contiguous on disk
+                conn.execute(
+                    '''CREATE TABLE IF NOT EXISTS price_points (
+                        crop_id INTEGER NOT NULL,
+                        location_id INTEGER NOT NULL,
+                        day INTEGER NOT NULL,
+                        mandi_id INTEGER NOT NULL,
+                        price INTEGER NOT NULL,
+                        min_price INTEGER,
+                        max_price INTEGER,
+                        source_id INTEGER,
+                        PRIMARY KEY (crop_id, location_id, day, mandi_id)
+                    ) WITHOUT ROWID'''
+                )
+                _schema_ready = True
+    return conn
+
+
+def _day(value):
+    """Days since 1970-01-01 for a YYYY-MM-DD string/date, or None if unparseable."""
+    if isinstance(value, date):
+        return (value - EPOCH).days
+    try:
+        return (datetime.strptime(str(value)[:10], '%Y-%m-%d').date() - EPOCH).days
+    except (TypeError, ValueError):
+        return None
+
+
+def _date(day):
+    return (EPOCH + timedelta(days=day)).isoformat()
+
+
+def _name_id(conn, kind, name, create=True):
+    cache_key = (kind, name)
+    name_id = _name_ids.get(cache_key)
+    if name_id is not None:
+        return name_id
+    row = conn.execute('SELECT id FROM ts_names WHERE kind = ? AND name = ?', (kind, name)).fetchone()
+    if row is None:
+        if not create:
+            return None
+        with _write_lock:
+            conn.execute('INSERT OR IGNORE INTO ts_names (kind, name) VALUES (?, ?)', (kind, name))
+            row = conn.execute('SELECT id FROM ts_names WHERE kind = ? AND name = ?', (kind, name)).fetchone()
+    _name_ids[cache_key] = row[0]
+    return row[0]
+
+
+def _int_price(value):
+    try:
+        return int(round(float(str(value).replace(',', ''))))
+    except (TypeError, ValueError):
+        return None
+
+
+def record_prices(payload, location, crop_name):
+    """Append every parsed mandi_prices record of a Gemini price payload. Returns rows written."""
+    records = ((payload or {}).get('data') or {}).get('mandi_prices') or []
+    today = _day(date.today())
+    rows = []
+    conn = get_conn()
+    crop_id = _name_id(conn, KIND_CROP, canonical_crop(crop_name))
+    location_id = _name_id(conn, KIND_LOCATION, canonical_location(location))
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        price = _int_price(record.get('price_per_quintal'))
+        if price is None:
+            continue
+        # Stamp the fetch day: last_updated is model output and often just echoes the
+        # prompt's example date, which would pile every fetch onto one fake past day
+        day = today
+        mandi = (record.get('mandi_name') or f"{location} Mandi").strip()
+        source = (record.get('source') or 'Gemini').strip()
+        rows.append((
+            crop_id, location_id, day, _name_id(conn, KIND_MANDI, mandi),
+            price, _int_price(record.get('min_price')), _int_price(record.get('max_price')),
+            _name_id(conn, KIND_SOURCE, source),
+        ))
+    if rows:
+        with _write_lock:
+            conn.execute('BEGIN')
+            try:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO price_points (crop_id, location_id, day, mandi_id, price, min_price, max_price, source_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+    return len(rows)
+
+
+def get_price_history(crop_name, location, start=None, end=None, bucket='daily', mandi=None):
+    """
+    Stored prices for a crop/location between start and end (YYYY-MM-DD, inclusive).
+    bucket: 'raw' (one point per mandi per day), 'daily' or 'weekly' (aggregated across
+    mandis; weeks start on Monday).
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    conn = get_conn()
+    crop_id = _name_id(conn, KIND_CROP, canonical_crop(crop_name), create=False)
+    location_id = _name_id(conn, KIND_LOCATION, canonical_location(location), create=False)
+    if crop_id is None or location_id is None:
+        return []
+    where = 'p.crop_id = ? AND p.location_id = ?'
+    params = [crop_id, location_id]
+    if start:
+        where += ' AND p.day >= ?'
+        params.append(_day(start))
+    if end:
+        where += ' AND p.day <= ?'
+        params.append(_day(end))
+    if mandi:
+        mandi_id = _name_id(conn, KIND_MANDI, mandi.strip(), create=False)
+        if mandi_id is None:
+            return []
+        where += ' AND p.mandi_id = ?'
+        params.append(mandi_id)
+
+    if bucket == 'raw':
+        rows = conn.execute(
+            f'''SELECT p.day, m.name, p.price, p.min_price, p.max_price, s.name
+                FROM price_points p
+                JOIN ts_names m ON m.id = p.mandi_id
+                LEFT JOIN ts_names s ON s.id = p.source_id
+                WHERE {where} ORDER BY p.day, m.name''',
+            params
+        ).fetchall()
+        return [{
+            'date': _date(r[0]),
+            'mandi_name': r[1],
+            'price_per_quintal': r[2],
+            'min_price': r[3],
+            'max_price': r[4],
+            'source': r[5],
+        } for r in rows]
+
+    # Epoch day 0 is a Thursday, so (day + 3) / 7 groups Monday..Sunday
+    bucket_expr = 'p.day' if bucket == 'daily' else '((p.day + 3) / 7) * 7 - 3'
+    rows = conn.execute(
+        f'''SELECT {bucket_expr} AS bucket, AVG(p.price), MIN(COALESCE(p.min_price, p.price)),
+                   MAX(COALESCE(p.max_price, p.price)), COUNT(*)
+            FROM price_points p WHERE {where}
+            GROUP BY bucket ORDER BY bucket''',
+        params
+    ).fetchall()
+    return [{
+        'date': _date(r[0]),
+        'price_per_quintal': int(round(r[1])),
+        'min_price': r[2],
+        'max_price': r[3],
+        'samples': r[4],
+    } for r in rows]
+
+
+def recent_history(crop_name, location, mandi=None, days=30):
+    """Last `days` of daily points in the {date, price_per_quintal} shape used by mandi 'history' arrays."""
+    start = date.today() - timedelta(days=days)
+    try:
+        points = get_price_history(crop_name, location, start=start, bucket='daily', mandi=mandi)
+    except sqlite3.Error as e:
+        print(f"Price history error: {e}")
+        return []
+    return [{'date': p['date'], 'price_per_quintal': p['price_per_quintal']} for p in points]
+
+
+def attach_history(payload, location, crop_name, min_points=2):
+    """Replace each mandi's history with stored points when we have at least min_points."""
+    for record in ((payload or {}).get('data') or {}).get('mandi_prices') or []:
+        if not isinstance(record, dict):
+            continue
+        history = recent_history(crop_name, location, mandi=(record.get('mandi_name') or '').strip() or None)
+        if len(history) >= min_points:
+            record['history'] = history
+    return payload
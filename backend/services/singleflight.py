@@ -0,0 +1,108 @@
+import threading
+import time
+
+from services.cache_store import acquire_lease, lease_held, release_lease, make_key
+
+# All single-flight groups created in this process (for the stats endpoint)
+_registry = {}
+
+
+class SingleFlightTimeout(TimeoutError):
+    pass
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key onto one upstream fetch.
+
+    Within a worker, the first caller for a key runs ``fn`` and every concurrent
+    caller waits (up to ``timeout``) for its result or exception. With
+    ``shared=True`` the leader also takes a lease in the cache database; if a
+    leader in another worker already holds it, we poll ``recheck()`` (usually a
+    cache lookup) until that worker's result lands, its lease goes away, or
+    the timeout expires, and only then fetch ourselves.
+    """
+
+    def __init__(self, name, shared=False, lease_seconds=60, poll_interval=0.1):
+        self.name = name
+        self.shared = shared
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {'leaders': 0, 'shared': 0, 'cross_worker_shared': 0, 'timeouts': 0}
+        _registry[name] = self
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def do(self, key, fn, timeout=30.0, recheck=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters['leaders'] += 1
+            else:
+                self._counters['shared'] += 1
+        if not leader:
+            if not call.event.wait(timeout):
+                self._count('timeouts')
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight {self.name} fetch")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._lead(key, fn, timeout, recheck)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _lead(self, key, fn, timeout, recheck):
+        if not self.shared:
+            return fn()
+        lease_key = key if isinstance(key, str) else make_key(*key)
+        owner = acquire_lease(self.name, lease_key, self.lease_seconds)
+        if owner is None and recheck is not None:
+            # Another worker is fetching this key: wait for its result to appear
+            deadline = time.monotonic() + (timeout or 0)
+            while True:
+                time.sleep(self.poll_interval)
+                # Check the lease before the cache: a released lease means the result is already stored
+                held = lease_held(self.name, lease_key)
+                result = recheck()
+                if result is not None:
+                    self._count('cross_worker_shared')
+                    return result
+                if not held or time.monotonic() >= deadline:
+                    break
+            owner = acquire_lease(self.name, lease_key, self.lease_seconds)
+        try:
+            return fn()
+        finally:
+            if owner is not None:
+                release_lease(self.name, lease_key, owner)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+
+def all_stats():
+    return {name: flight.stats() for name, flight in _registry.items()}
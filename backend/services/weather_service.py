@@ -1,27 +1,216 @@
+import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
 import requests
+from services.cache_store import CacheStore
+from services.singleflight import SingleFlight, SingleFlightTimeout
+from services.gazetteer import canonical_location
+from services.geocoder import geocode
+from services.openweather_client import OPENWEATHER_FORECAST_URL, get as openweather_get
 
-OPENWEATHER_API_URL = 'https://api.openweathermap.org/data/2.5/forecast'
+# OpenWeather publishes a new 5-day forecast every 3 hours (00, 03, ... UTC);
+# cached forecasts expire at the next boundary plus a grace period for publishing
+FORECAST_INTERVAL_SECONDS = 3 * 3600
+FORECAST_GRACE_SECONDS = int(os.getenv('WEATHER_FORECAST_GRACE_SECONDS', '300'))
+# Places with coordinates are keyed by grid cell, so neighbouring districts share one forecast
+WEATHER_GRID_DEGREES = float(os.getenv('WEATHER_GRID_DEGREES', '0.1'))
 
-def get_weather_forecast(location):
-    OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
-    params = {
-        'q': location,
-        'appid': OPENWEATHER_API_KEY,
-        'units': 'metric'
-    }
-    resp = requests.get(OPENWEATHER_API_URL, params=params)
+# Shared cache (SQLite, all workers): grid cell or location -> columnar 3-hour forecast slots
+FORECAST_CACHE_VERSION = 2
+forecast_cache = CacheStore(
+    'weather_forecast',
+    ttl_seconds=FORECAST_INTERVAL_SECONDS,
+    max_entries=int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '2000')),
+)
+WEATHER_WAIT_SECONDS = float(os.getenv('WEATHER_WAIT_SECONDS', '15'))
+forecast_flight = SingleFlight('weather_forecast', shared=True, lease_seconds=30)
+
+# Per-slot columns kept from the OpenWeather response
+SLOT_COLUMNS = ('dt', 'temp', 'temp_min', 'temp_max', 'humidity', 'rain', 'wind')
+DAILY_COLUMNS = ('date', 'slots', 'temp_min', 'temp_max', 'temp_mean', 'rain_mm', 'wind_max', 'humidity_mean', 'gdd', 'et0_mm', 'water_balance_mm')
+
+# Growing degree day base temperature (deg C); 10 suits most kharif crops
+GDD_BASE_C = float(os.getenv('GDD_BASE_C', '10'))
+WEATHER_BATCH_MAX_LOCATIONS = int(os.getenv('WEATHER_BATCH_MAX_LOCATIONS', '50'))
+batch_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('WEATHER_BATCH_WORKERS', '4')),
+    thread_name_prefix='weather-batch'
+)
+
+
+def seconds_to_next_forecast(now=None):
+    now = time.time() if now is None else now
+    return FORECAST_INTERVAL_SECONDS - (now % FORECAST_INTERVAL_SECONDS) + FORECAST_GRACE_SECONDS
+
+
+def forecast_query(location):
+    """(cache key, OpenWeather query params) for a location."""
+    # Known and previously geocoded places go by coordinates; OpenWeather's own name lookup is the fallback
+    coords = geocode(location)
+    if coords:
+        lat, lon = (round(round(c / WEATHER_GRID_DEGREES) * WEATHER_GRID_DEGREES, 4) for c in coords)
+        return (FORECAST_CACHE_VERSION, 'grid', lat, lon), {'lat': lat, 'lon': lon}
+    return (FORECAST_CACHE_VERSION, 'q', canonical_location(location)), {'q': location}
+
+
+def _parse_columns(data):
+    """One list per field instead of one dict per slot (smaller to cache and ready for NumPy)."""
+    columns = {name: [] for name in SLOT_COLUMNS}
+    for entry in data.get('list', []):
+        main = entry['main']
+        columns['dt'].append(entry['dt'])
+        columns['temp'].append(main['temp'])
+        columns['temp_min'].append(main.get('temp_min', main['temp']))
+        columns['temp_max'].append(main.get('temp_max', main['temp']))
+        columns['humidity'].append(main['humidity'])
+        columns['rain'].append(entry.get('rain', {}).get('3h', 0))
+        columns['wind'].append(entry['wind']['speed'])
+    city = data.get('city') or {}
+    columns['lat'] = (city.get('coord') or {}).get('lat')
+    columns['tz_offset'] = city.get('timezone', 0)
+    return columns
+
+
+def _fetch_forecast(key, params):
+    cached = forecast_cache.get(key, count=False)
+    if cached is not None:
+        return cached
+    try:
+        resp = openweather_get(OPENWEATHER_FORECAST_URL, dict(params, units='metric'))
+    except requests.RequestException as e:
+        print(f"OpenWeather error: {e}")
+        return None
     if not resp.ok:
+        print("OpenWeather error:", resp.status_code, resp.text[:200])
+        return None
+    columns = _parse_columns(resp.json())
+    forecast_cache.set(key, columns, ttl_seconds=seconds_to_next_forecast())
+    return columns
+
+
+def get_forecast_columns(location):
+    """All 3-hour forecast slots (up to 40) for a location as columns, or None on upstream error."""
+    key, params = forecast_query(location)
+    columns = forecast_cache.get(key)
+    if columns is not None:
+        return columns
+    try:
+        return forecast_flight.do(
+            key, lambda: _fetch_forecast(key, params),
+            timeout=WEATHER_WAIT_SECONDS,
+            recheck=lambda: forecast_cache.get(key, count=False),
+        )
+    except SingleFlightTimeout:
+        return None
+
+
+def _slot_time(dt):
+    return datetime.fromtimestamp(dt, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def get_weather_forecast(location):
+    columns = get_forecast_columns(location)
+    if columns is None:
         return {"error": "OpenWeatherMap API error"}
-    data = resp.json()
     # Extract 5-day summary (simplified)
-    forecast = []
-    for entry in data['list'][:5]:
-        forecast.append({
-            'datetime': entry['dt_txt'],
-            'temp': entry['main']['temp'],
-            'humidity': entry['main']['humidity'],
-            'rain': entry.get('rain', {}).get('3h', 0),
-            'wind': entry['wind']['speed']
-        })
-    return forecast
+    return [{
+        'datetime': _slot_time(columns['dt'][i]),
+        'temp': columns['temp'][i],
+        'humidity': columns['humidity'][i],
+        'rain': columns['rain'][i],
+        'wind': columns['wind'][i],
+    } for i in range(min(5, len(columns['dt'])))]
+
+
+def _extraterrestrial_radiation(lat_deg, day_of_year):
+    """FAO-56 extraterrestrial radiation Ra (MJ/m2/day) for arrays of latitude and day of year."""
+    phi = np.radians(lat_deg)
+    dr = 1 + 0.033 * np.cos(2 * math.pi * day_of_year / 365)
+    delta = 0.409 * np.sin(2 * math.pi * day_of_year / 365 - 1.39)
+    ws = np.arccos(np.clip(-np.tan(phi) * np.tan(delta), -1, 1))
+    return (24 * 60 / math.pi) * 0.0820 * dr * (ws * np.sin(phi) * np.sin(delta) + np.cos(phi) * np.cos(delta) * np.sin(ws))
+
+
+def daily_rollups(forecasts):
+    """
+    Daily agronomic aggregates for many forecasts at once.
+
+    forecasts: list of column dicts from get_forecast_columns. All slots are stacked
+    into flat arrays and grouped by (forecast, local day) in one vectorized pass.
+    Returns one dict of daily columns per forecast, in input order: date, slots,
+    temp_min/max/mean (deg C), rain_mm, wind_max (m/s), humidity_mean (%),
+    gdd (base GDD_BASE_C), et0_mm (Hargreaves) and water_balance_mm (rain - ET0).
+    Days at the ends of the 5-day window may be partial; `slots` says how many
+    3-hour slots each day covers.
+    """
+    sizes = [len(f['dt']) for f in forecasts]
+    if not sum(sizes):
+        return [{name: [] for name in DAILY_COLUMNS} for _ in forecasts]
+    owner = np.repeat(np.arange(len(forecasts)), sizes)
+    offsets = np.repeat([f.get('tz_offset') or 0 for f in forecasts], sizes)
+    col = {name: np.concatenate([np.asarray(f[name], dtype=float) for f in forecasts]) for name in SLOT_COLUMNS}
+    local_day = (col['dt'].astype(np.int64) + offsets) // 86400
+    # Slots arrive sorted by time within each forecast, so each (owner, day) group is contiguous
+    starts = np.flatnonzero(np.r_[True, (owner[1:] != owner[:-1]) | (local_day[1:] != local_day[:-1])])
+    counts = np.diff(np.r_[starts, len(owner)])
+
+    tmin = np.minimum.reduceat(col['temp_min'], starts)
+    tmax = np.maximum.reduceat(col['temp_max'], starts)
+    tmean = np.add.reduceat(col['temp'], starts) / counts
+    rain = np.add.reduceat(col['rain'], starts)
+    wind_max = np.maximum.reduceat(col['wind'], starts)
+    humidity = np.add.reduceat(col['humidity'], starts) / counts
+    gdd = np.maximum(0, (tmax + tmin) / 2 - GDD_BASE_C)
+
+    days = local_day[starts]
+    day_owner = owner[starts]
+    dates = days.astype('datetime64[D]')
+    day_of_year = (dates - dates.astype('datetime64[Y]')).astype(int) + 1
+    lats = np.array([f.get('lat') if f.get('lat') is not None else np.nan for f in forecasts])[day_owner]
+    ra = _extraterrestrial_radiation(lats, day_of_year)
+    # Hargreaves ET0 (mm/day); 0.408 converts MJ/m2 to mm of evaporated water
+    et0 = 0.0023 * 0.408 * ra * (tmean + 17.8) * np.sqrt(np.maximum(tmax - tmin, 0))
+
+    out = {
+        'date': dates.astype(str),
+        'slots': counts,
+        'temp_min': np.round(tmin, 1),
+        'temp_max': np.round(tmax, 1),
+        'temp_mean': np.round(tmean, 1),
+        'rain_mm': np.round(rain, 1),
+        'wind_max': np.round(wind_max, 1),
+        'humidity_mean': np.round(humidity),
+        'gdd': np.round(gdd, 1),
+        'et0_mm': np.round(et0, 1),
+        'water_balance_mm': np.round(rain - et0, 1),
+    }
+    bounds = np.searchsorted(day_owner, np.arange(len(forecasts) + 1))
+    results = []
+    for i in range(len(forecasts)):
+        lo, hi = bounds[i], bounds[i + 1]
+        # NaN (unknown latitude) becomes null in JSON
+        results.append({name: [None if isinstance(v, float) and v != v else v for v in values[lo:hi].tolist()] for name, values in out.items()})
+    return results
+
+
+def get_full_forecast(location):
+    """All 40 slots as columns plus daily rollups: {'slots': {...}, 'daily': {...}}, or an error dict."""
+    return get_full_forecasts([location])[0]
+
+
+def get_full_forecasts(locations):
+    """get_full_forecast for a batch of locations; misses are fetched concurrently."""
+    forecasts = list(batch_pool.map(get_forecast_columns, locations)) if len(locations) > 1 else [get_forecast_columns(locations[0])]
+    found = [f for f in forecasts if f is not None]
+    rollups = iter(daily_rollups(found)) if found else iter(())
+    results = []
+    for location, columns in zip(locations, forecasts):
+        if columns is None:
+            results.append({'location': location, 'error': 'OpenWeatherMap API error'})
+            continue
+        slots = {name: columns[name] for name in SLOT_COLUMNS}
+        results.append({'location': location, 'tz_offset': columns.get('tz_offset', 0), 'slots': slots, 'daily': next(rollups)})
+    return results